@@ -0,0 +1,239 @@
+"""Append-only local Parquet store of extracted reports for cross-report queries.
+
+Every extraction appends one Parquet file per non-empty section under
+
+    {ANALYTICS_STORE_DIR}/{section}/extractedDate=YYYY-MM-DD/{report id}.parquet
+
+plus a row of summary figures in the ``reports`` table. Rows carry
+``sourceFileName``, ``extractedAt`` and ``reportId``; re-extracting a file
+appends a new version rather than rewriting the old one, and queries use the
+latest version of each file unless ``latest=False``.
+
+    import analytics_store
+    analytics_store.query("bmps", group_by=["category"], aggregates={"cost": "sum"},
+                          filters=[("extractedDate", ">=", "2024-01-01")])
+
+Queries read only the referenced columns and skip partitions excluded by
+``extractedDate`` filters. Each partition's small files are merged once there
+are ``COMPACT_AFTER_FILES`` of them (or on ``compact()``), so a scan over
+thousands of reports opens a handful of files.
+"""
+import fcntl
+import os
+import re
+import threading
+import uuid
+import warnings
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import report_frames
+
+STORE_DIR_ENV_VAR = "ANALYTICS_STORE_DIR"
+DEFAULT_STORE_DIR = ".cache/analytics"
+
+REPORTS = "reports"
+PARTITION = "extractedDate"
+KEY_COLUMNS = {"sourceFileName": pa.string(), "extractedAt": pa.timestamp("us", tz="UTC"), "reportId": pa.string()}
+
+_ARROW_TYPES = {
+    report_frames.NUMERIC: pa.float64(),
+    report_frames.CATEGORY: pa.string(),
+    report_frames.TEXT: pa.string(),
+    report_frames.DATE: pa.timestamp("ms"),
+}
+
+# One fixed schema per table, so files written at different times (and
+# partitions with different value ranges) always scan as one dataset.
+SCHEMAS = {
+    section: pa.schema(list(KEY_COLUMNS.items()) + [(name, _ARROW_TYPES[kind]) for name, kind in columns.items()])
+    for section, columns in report_frames.COLUMNS.items()
+}
+SCHEMAS[REPORTS] = pa.schema(list(KEY_COLUMNS.items()) + [
+    ("totalGoals", pa.float64()),
+    ("totalBMPs", pa.float64()),
+    ("completionRate", pa.float64()),
+] + [(f"{section}Count", pa.int64()) for section in report_frames.COLUMNS])
+
+# A partition is merged into one file once it holds this many; scans over
+# thousands of one-report files are dominated by opening them.
+COMPACT_AFTER_FILES = 64
+
+_compact_lock = threading.Lock()
+
+
+def default_store_dir():
+    return os.environ.get(STORE_DIR_ENV_VAR, DEFAULT_STORE_DIR)
+
+
+def _safe_name(file_name):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", file_name)[:80]
+
+
+def _table(frame, schema):
+    columns = {}
+    for field in schema:
+        series = frame[field.name] if field.name in frame else None
+        if series is None:
+            columns[field.name] = pa.nulls(len(frame), field.type)
+        elif pa.types.is_string(field.type):
+            columns[field.name] = pa.array(series.astype("object").where(series.notna(), None), field.type)
+        else:
+            columns[field.name] = pa.array(series, field.type, from_pandas=True)
+    return pa.table(columns, schema=schema)
+
+
+@contextmanager
+def _partition_lock(directory):
+    # Job workers append from several processes; only one of them may merge
+    # a partition at a time or rows would be merged (and counted) twice.
+    with _compact_lock, open(directory / ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _compact_partition(directory, schema, min_files=2):
+    """Merge a partition's files; call with ``_partition_lock(directory)`` held."""
+    files = sorted(directory.glob("*.parquet"))
+    if len(files) < min_files:
+        return
+    merged = pa.concat_tables(pq.read_table(f, schema=schema) for f in files)
+    tmp_path = directory / f".compacted-{uuid.uuid4().hex[:8]}.tmp"
+    pq.write_table(merged, tmp_path)
+    os.replace(tmp_path, directory / f"compacted-{uuid.uuid4().hex[:8]}.parquet")
+    for f in files:
+        f.unlink()
+
+
+class AnalyticsStore:
+    def __init__(self, root=None):
+        self.root = Path(root or default_store_dir())
+
+    # ---------- Writing ----------
+    def append_report(self, file_name, report, extracted_at=None):
+        """Append one extraction of ``file_name``; returns its report id."""
+        import pandas as pd
+
+        extracted_at = extracted_at or datetime.now(timezone.utc)
+        report_id = f"{_safe_name(file_name)}-{extracted_at:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        keys = {"sourceFileName": file_name, "extractedAt": extracted_at, "reportId": report_id}
+
+        frames = report_frames.normalize_report(report)
+        summary = report.get("summary") or {}
+        frames[REPORTS] = pd.DataFrame([{
+            "totalGoals": summary.get("totalGoals"),
+            "totalBMPs": summary.get("totalBMPs"),
+            "completionRate": summary.get("completionRate"),
+            **{f"{section}Count": len(report.get(section) or []) for section in report_frames.COLUMNS},
+        }])
+
+        partition = f"{PARTITION}={extracted_at:%Y-%m-%d}"
+        for table_name, frame in frames.items():
+            frame = frame.assign(**keys)
+            directory = self.root / table_name / partition
+            directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = directory / f".{report_id}.tmp"
+            pq.write_table(_table(frame, SCHEMAS[table_name]), tmp_path)
+            os.replace(tmp_path, directory / f"{report_id}.parquet")
+            with _partition_lock(directory):
+                _compact_partition(directory, SCHEMAS[table_name], min_files=COMPACT_AFTER_FILES)
+        return report_id
+
+    def compact(self):
+        """Merge each partition's files into one (same rows, fewer files)."""
+        for table_name, schema in SCHEMAS.items():
+            for directory in (self.root / table_name).glob(f"{PARTITION}=*"):
+                with _partition_lock(directory):
+                    _compact_partition(directory, schema)
+
+    # ---------- Reading ----------
+    def dataset(self, table_name):
+        schema = SCHEMAS[table_name].append(pa.field(PARTITION, pa.string()))
+        return ds.dataset(self.root / table_name, format="parquet", partitioning="hive", schema=schema)
+
+    def latest_report_ids(self):
+        """Ids of the most recent extraction of every source file."""
+        table = self.scan(REPORTS, ["sourceFileName", "extractedAt", "reportId"], latest=False)
+        if table.num_rows == 0:
+            return set()
+        table = table.sort_by([("sourceFileName", "ascending"), ("extractedAt", "descending")])
+        names = table["sourceFileName"].to_pylist()
+        ids = table["reportId"].to_pylist()
+        return {ids[i] for i in range(len(names)) if i == 0 or names[i] != names[i - 1]}
+
+    def scan(self, table_name, columns=None, filters=None, latest=True):
+        """Arrow table of ``columns`` for rows matching ``filters``.
+
+        ``filters`` is a list of ``(column, op, value)`` tuples combined with
+        AND, as accepted by ``pyarrow.parquet.read_table``; ops are
+        ``== != < <= > >= in not in``. Filters on ``extractedDate`` prune
+        whole partitions.
+        """
+        if not (self.root / table_name).exists():
+            schema = SCHEMAS[table_name]
+            return schema.empty_table().select(columns) if columns else schema.empty_table()
+        expression = pq.filters_to_expression(filters) if filters else None
+        if latest:
+            report_ids = pa.array(sorted(self.latest_report_ids()), pa.string())
+            latest_filter = pc.field("reportId").isin(report_ids)
+            expression = latest_filter if expression is None else expression & latest_filter
+        return self.dataset(table_name).to_table(columns=columns, filter=expression)
+
+    def query(self, table_name, group_by=(), aggregates=None, filters=None, latest=True):
+        """Filtered, grouped aggregation as a pandas DataFrame.
+
+        ``aggregates`` maps column -> function name or list of names (any
+        pyarrow hash aggregation: sum, mean, min, max, count, count_distinct,
+        ...), e.g. ``{"cost": ["sum", "mean"]}``. Without aggregates the
+        matching rows are returned. Result columns are named
+        ``{column}_{function}``.
+        """
+        group_by = list(group_by)
+        aggregates = {
+            column: [functions] if isinstance(functions, str) else list(functions)
+            for column, functions in (aggregates or {}).items()
+        }
+        columns = None if not aggregates else list(dict.fromkeys(group_by + list(aggregates)))
+        table = self.scan(table_name, columns, filters, latest)
+        if aggregates:
+            table = table.group_by(group_by).aggregate(
+                [(column, function) for column, functions in aggregates.items() for function in functions]
+            )
+        return table.to_pandas()
+
+
+_default_store = None
+
+
+def get_default_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = AnalyticsStore()
+    return _default_store
+
+
+def record_report(file_name, report):
+    """Append ``report`` to the default store; never fails the extraction.
+
+    Does nothing when ANALYTICS_STORE_DIR is set to an empty string.
+    """
+    if not default_store_dir():
+        return None
+    try:
+        return get_default_store().append_report(file_name, report)
+    except Exception as e:
+        warnings.warn(f"Could not record {file_name} in the analytics store: {e}")
+        return None
+
+
+def query(table_name, group_by=(), aggregates=None, filters=None, latest=True):
+    return get_default_store().query(table_name, group_by, aggregates, filters, latest)
@@ -0,0 +1,133 @@
+"""Headless batch extraction of watershed plan PDFs.
+
+    python batch_cli.py reports/ -o results.jsonl --workers 4 [--upload]
+    python batch_cli.py "archive/**/*.pdf" -o results.jsonl --upload --incremental
+
+Each processed PDF becomes one JSON line in the output file. Re-running with
+the same output file skips PDFs that already have a successful line, so an
+interrupted backfill can simply be restarted.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import analytics_store
+import firebase_database
+import pdf_extraction
+import tracing
+
+ROOT = Path(__file__).resolve().parent
+
+
+def find_pdfs(source):
+    path = Path(source)
+    if path.is_dir():
+        return sorted(str(p.resolve()) for p in path.rglob("*.pdf"))
+    if path.is_file():
+        return [str(path.resolve())]
+    return sorted(str(Path(p).resolve()) for p in glob.glob(source, recursive=True))
+
+
+def completed_files(output_path):
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run; that file is redone.
+                continue
+            if record.get("status") == "ok":
+                done.add(record["path"])
+    return done
+
+
+def process_pdf(path, json_schema, prompt_template, upload=False, incremental=False):
+    started = time.perf_counter()
+    record = {
+        "path": path,
+        "sourceFileName": os.path.basename(path),
+        "pdfSha256": pdf_extraction.file_sha256(path),
+    }
+    with tracing.start_trace("batch_cli", sourceFileName=record["sourceFileName"]) as trace:
+        try:
+            data = firebase_database.extract_structured_data(
+                path, json_schema, prompt_template, file_name=record["sourceFileName"]
+            )
+            record["data"] = data
+            analytics_store.record_report(record["sourceFileName"], data)
+            if upload:
+                sync = firebase_database.sync_data_incremental if incremental else firebase_database.upload_data_normalized
+                record["upload"] = sync(record["sourceFileName"], data.get("summary", {}), data)
+            record["status"] = "ok"
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+            trace.error = record["error"]
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    record["traceId"] = trace.trace_id
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="directory of PDFs, a single PDF, or a glob pattern")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL file to append results to")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="PDFs processed concurrently")
+    parser.add_argument("--upload", action="store_true", help="also upload each report to Firestore")
+    parser.add_argument("--incremental", action="store_true",
+                        help="with --upload, write only added/changed docs (sync_data_incremental)")
+    parser.add_argument("--no-resume", action="store_true", help="reprocess files already in the output")
+    parser.add_argument("--secrets", help='secrets source: "env", "file:<path>" or "streamlit" (see settings.py)')
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port while running")
+    parser.add_argument("--schema", default=str(ROOT / "schema.json"))
+    parser.add_argument("--prompt", default=str(ROOT / "prompt.txt"))
+    args = parser.parse_args(argv)
+
+    pdfs = find_pdfs(args.source)
+    done = set() if args.no_resume else completed_files(args.output)
+    todo = [p for p in pdfs if p not in done]
+    print(f"{len(pdfs)} PDFs found, {len(pdfs) - len(todo)} already done, {len(todo)} to process", file=sys.stderr)
+    if not todo:
+        return 0
+
+    tracing.start_metrics_server(args.metrics_port)
+
+    # Fail fast on missing credentials/dependencies rather than once per file.
+    firebase_database.configure(args.secrets)
+    firebase_database.get_model()
+    if args.upload:
+        firebase_database.get_db()
+
+    with open(args.schema, "r", encoding="utf-8") as f:
+        json_schema = json.load(f)
+    with open(args.prompt, "r", encoding="utf-8") as f:
+        prompt_template = f.read()
+
+    failures = 0
+    with open(args.output, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [
+            pool.submit(process_pdf, path, json_schema, prompt_template, args.upload, args.incremental)
+            for path in todo
+        ]
+        for n, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            # One writer thread, one line per report, flushed so a crash loses at most the current line.
+            out.write(json.dumps(record, default=str) + "\n")
+            out.flush()
+            if record["status"] != "ok":
+                failures += 1
+            print(f"[{n}/{len(todo)}] {record['status']:5} {record['seconds']:7.1f}s {record['path']}", file=sys.stderr)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
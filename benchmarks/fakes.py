@@ -0,0 +1,188 @@
+"""Offline stand-ins for the Gemini model and the Firestore client."""
+import itertools
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+FIRESTORE_BATCH_LIMIT = 500
+
+
+# ---------- Gemini ----------
+def _fake_value(prop_schema, rng, field):
+    types = prop_schema.get("type", "string")
+    types = [types] if isinstance(types, str) else [t for t in types if t != "null"]
+    if "enum" in prop_schema:
+        return rng.choice([v for v in prop_schema["enum"] if v is not None])
+    if "number" in types:
+        low, high = prop_schema.get("minimum", 0), prop_schema.get("maximum", 1000)
+        return rng.randint(low, high)
+    if prop_schema.get("format") == "date":
+        return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    return f"{field} {rng.randint(0, 10 ** 6)}"
+
+
+def fake_report(schema, items_per_section=20, seed=0):
+    """A report that validates against ``schema`` (schema.json layout)."""
+    rng = random.Random(seed)
+    report = {}
+    for section, section_schema in schema["properties"].items():
+        if section_schema["type"] == "object":
+            continue
+        props = section_schema["items"]["properties"]
+        report[section] = [
+            {field: _fake_value(prop, rng, field) for field, prop in props.items()}
+            for _ in range(items_per_section)
+        ]
+    report["summary"] = {
+        "totalGoals": len(report.get("goals", [])),
+        "totalBMPs": len(report.get("bmps", [])),
+        "completionRate": rng.randint(0, 100),
+    }
+    return report
+
+
+class StubModel:
+    """Replaces genai.GenerativeModel: fixed latency, schema-valid JSON."""
+
+    def __init__(self, schema, latency=0.5, items_per_section=20):
+        self.schema = schema
+        self.latency = latency
+        self.items_per_section = items_per_section
+        self.calls = 0
+        self._seed = itertools.count()
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, generation_config=None):
+        with self._lock:
+            self.calls += 1
+            seed = next(self._seed)
+        time.sleep(self.latency)
+        text = json.dumps(fake_report(self.schema, self.items_per_section, seed))
+        return SimpleNamespace(
+            text=text,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=len(prompt) // 4,
+                candidates_token_count=len(text) // 4,
+            ),
+        )
+
+
+# ---------- Firestore ----------
+class FakeFirestoreError(Exception):
+    def __init__(self, message, code=400):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db, collection, doc_id):
+        self._db = db
+        self.collection_name = collection
+        self.id = doc_id
+
+    def get(self):
+        self._db._count("reads")
+        return FakeSnapshot(self, self._db._store(self.collection_name).get(self.id))
+
+    def set(self, data):
+        self._db._apply([("set", self, data)])
+
+    def delete(self):
+        self._db._apply([("delete", self, None)])
+
+
+class FakeQuery:
+    def __init__(self, db, collection, filters=(), fields=None):
+        self._db = db
+        self._collection = collection
+        self._filters = filters
+        self._fields = fields
+
+    def where(self, field, op, value):
+        assert op == "==", "FakeFirestore only supports equality filters"
+        return FakeQuery(self._db, self._collection, self._filters + ((field, value),), self._fields)
+
+    def select(self, fields):
+        return FakeQuery(self._db, self._collection, self._filters, list(fields))
+
+    def stream(self):
+        with self._db._lock:
+            items = list(self._db._store(self._collection).items())
+        for doc_id, data in items:
+            if all(data.get(f) == v for f, v in self._filters):
+                self._db._count("reads")
+                if self._fields is not None:
+                    data = {f: data[f] for f in self._fields if f in data}
+                yield FakeSnapshot(FakeDocument(self._db, self._collection, doc_id), data)
+
+
+class FakeCollection(FakeQuery):
+    def document(self, doc_id):
+        return FakeDocument(self._db, self._collection, doc_id)
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, doc_ref, data):
+        self._ops.append(("set", doc_ref, data))
+
+    def delete(self, doc_ref):
+        self._ops.append(("delete", doc_ref, None))
+
+    def commit(self):
+        if len(self._ops) > FIRESTORE_BATCH_LIMIT:
+            raise FakeFirestoreError(f"maximum {FIRESTORE_BATCH_LIMIT} writes allowed per request")
+        self._db._apply(self._ops)
+
+
+class FakeFirestore:
+    """In-memory Firestore client with the 500-operation batch limit and an
+    optional per-commit latency."""
+
+    def __init__(self, commit_latency=0.0):
+        self.commit_latency = commit_latency
+        self.counters = {"reads": 0, "writes": 0, "deletes": 0, "commits": 0}
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def _store(self, name):
+        return self._collections.setdefault(name, {})
+
+    def _count(self, counter, n=1):
+        with self._lock:
+            self.counters[counter] += n
+
+    def _apply(self, ops):
+        time.sleep(self.commit_latency)
+        with self._lock:
+            self.counters["commits"] += 1
+            for kind, doc_ref, data in ops:
+                store = self._store(doc_ref.collection_name)
+                if kind == "set":
+                    store[doc_ref.id] = dict(data)
+                    self.counters["writes"] += 1
+                else:
+                    store.pop(doc_ref.id, None)
+                    self.counters["deletes"] += 1
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
@@ -0,0 +1,114 @@
+"""Offline end-to-end benchmark of the extraction pipeline.
+
+    python benchmarks/run_benchmarks.py --pages 50 200 --scanned-every 10 \
+        --llm-latency 2.0 --runs 5 --output bench_output.txt
+
+Synthetic PDFs stand in for uploads, StubModel for Gemini and FakeFirestore
+for Firestore, so nothing leaves the machine. For every stage it reports
+throughput and p50/p95 latency over ``--runs`` runs.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+import firebase_database  # noqa: E402
+from fakes import FakeFirestore, StubModel  # noqa: E402
+from synthetic_pdfs import generate_plan_pdf  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def timed_runs(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def report_line(stage, pages, samples, units, unit_name):
+    total = sum(samples)
+    return {
+        "stage": stage,
+        "pages": pages,
+        "runs": len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "throughput": units * len(samples) / total if total else 0.0,
+        "throughputUnit": unit_name,
+    }
+
+
+def bench_document(pages, args, json_schema, prompt_template):
+    pdf_bytes = generate_plan_pdf(pages, scanned_every=args.scanned_every, seed=pages)
+    results = []
+
+    text = firebase_database.extract_text_from_pdf(pdf_bytes)
+    results.append(report_line(
+        "extract_text_from_pdf", pages,
+        timed_runs(lambda: firebase_database.extract_text_from_pdf(pdf_bytes), args.runs),
+        pages, "pages/s",
+    ))
+
+    data = firebase_database.generate_structured_data(text, json_schema, prompt_template)
+    results.append(report_line(
+        "generate_structured_data", pages,
+        timed_runs(lambda: firebase_database.generate_structured_data(text, json_schema, prompt_template), args.runs),
+        1, "calls/s",
+    ))
+
+    docs = 1 + sum(len(data.get(section, [])) for section in firebase_database.SECTIONS)
+    results.append(report_line(
+        "upload_data_normalized", pages,
+        timed_runs(lambda: firebase_database.upload_data_normalized(f"bench-{pages}.pdf", data["summary"], data), args.runs),
+        docs, "docs/s",
+    ))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[20, 100])
+    parser.add_argument("--scanned-every", type=int, default=0, help="make every Nth page a scanned image (0: none)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per stub model call")
+    parser.add_argument("--items-per-section", type=int, default=200, help="rows per section in stub responses")
+    parser.add_argument("--commit-latency", type=float, default=0.02, help="seconds per fake Firestore commit")
+    parser.add_argument("--no-ocr", action="store_true", help="skip OCR of scanned pages")
+    parser.add_argument("--output", help="also append JSON lines with the results here")
+    args = parser.parse_args(argv)
+
+    if args.no_ocr:
+        os.environ["OCR_ENABLED"] = "0"
+
+    json_schema = firebase_database.get_json_schema(str(HERE.parent / "schema.json"))
+    prompt_template = "{pdf_text}"
+    firebase_database.use_clients(
+        db=FakeFirestore(commit_latency=args.commit_latency),
+        model=StubModel(json_schema, latency=args.llm_latency, items_per_section=args.items_per_section),
+    )
+
+    print(f"{'stage':26} {'pages':>6} {'p50 s':>8} {'p95 s':>8} {'throughput':>18}")
+    for pages in args.pages:
+        for line in bench_document(pages, args, json_schema, prompt_template):
+            print(f"{line['stage']:26} {line['pages']:>6} {line['p50']:>8.3f} {line['p95']:>8.3f} "
+                  f"{line['throughput']:>10.1f} {line['throughputUnit']}")
+            if args.output:
+                with open(args.output, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(line) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""Synthetic watershed-plan PDFs for benchmarking, built with PyMuPDF."""
+import random
+
+import pymupdf
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+LINES_PER_PAGE = 40
+
+_WORDS = (
+    "watershed nutrient loading sediment phosphorus nitrogen cropland wetland "
+    "buffer stream bank stabilization cover crops irrigation monitoring outreach "
+    "landowners acres implementation milestone baseline target reduction BMP "
+    "conservation tillage riparian grazing management county district plan goal"
+).split()
+
+_HEADINGS = ["GOALS", "BEST MANAGEMENT PRACTICES", "IMPLEMENTATION", "MONITORING", "OUTREACH", "GEOGRAPHIC AREAS"]
+
+
+def _page_lines(rng, page_number):
+    lines = [f"Watershed Management Plan - Page {page_number + 1}", _HEADINGS[page_number % len(_HEADINGS)]]
+    while len(lines) < LINES_PER_PAGE:
+        lines.append(" ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 14))))
+    return lines
+
+
+def _write_lines(page, lines):
+    for i, line in enumerate(lines):
+        page.insert_text((54, 50 + i * 18), line, fontsize=10)
+
+
+def generate_plan_pdf(pages, scanned_every=0, seed=0):
+    """Return PDF bytes with ``pages`` pages of plan-like text.
+
+    Every ``scanned_every``-th page (0 disables) is an image of text with no
+    text layer, like a scanned page.
+    """
+    rng = random.Random(seed)
+    doc = pymupdf.open()
+    for page_number in range(pages):
+        lines = _page_lines(rng, page_number)
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        if scanned_every and page_number % scanned_every == scanned_every - 1:
+            # Render the text on a scratch page, then embed only the picture.
+            scratch = pymupdf.open()
+            _write_lines(scratch.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT), lines)
+            pixmap = scratch[0].get_pixmap(dpi=100, colorspace="gray")
+            page.insert_image(page.rect, pixmap=pixmap)
+            scratch.close()
+        else:
+            _write_lines(page, lines)
+    data = doc.tobytes()
+    doc.close()
+    return data
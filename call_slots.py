@@ -0,0 +1,92 @@
+"""Cap on model calls in flight across processes.
+
+Job-queue workers each run their own thread pools, so a per-process limit
+does not bound the pool as a whole. ``CallSlots`` hands out at most
+``limit()`` slots, one lock file per slot under a shared directory; a model
+call holds a slot for the duration of the request (not during retry
+backoff). The limit defaults to LLM_MAX_CONCURRENCY and can be changed at
+runtime with ``set_limit`` (e.g. from the frontend's sidebar).
+
+Calls outside any pool (no ``LLM_SLOT_DIR``) are not limited here.
+"""
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+import tracing
+from chunked_extraction import default_concurrency
+
+SLOT_DIR_ENV_VAR = "LLM_SLOT_DIR"
+
+# Seconds between attempts to take a slot while all are held.
+WAIT_SECONDS = 0.05
+
+
+class CallSlots:
+    def __init__(self, slot_dir):
+        self.slot_dir = Path(slot_dir)
+        self.slot_dir.mkdir(parents=True, exist_ok=True)
+
+    def limit(self):
+        try:
+            return max(1, int((self.slot_dir / "limit").read_text()))
+        except (OSError, ValueError):
+            return default_concurrency()
+
+    def set_limit(self, limit):
+        tmp_path = self.slot_dir / f"limit.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp_path.write_text(str(int(limit)))
+        os.replace(tmp_path, self.slot_dir / "limit")
+
+    def _try_slot(self, index):
+        slot_file = open(self.slot_dir / f"slot-{index}.lock", "a")
+        try:
+            fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            slot_file.close()
+            return None
+        return slot_file
+
+    @contextmanager
+    def slot(self):
+        """Hold one slot; waits while ``limit()`` calls are in flight."""
+        waited = None
+        while True:
+            for index in range(self.limit()):
+                slot_file = self._try_slot(index)
+                if slot_file is not None:
+                    break
+            else:
+                if waited is None:
+                    waited = time.perf_counter()
+                    tracing.count("llm_slot_waits")
+                time.sleep(WAIT_SECONDS)
+                continue
+            break
+        if waited is not None:
+            tracing.count("llm_slot_wait_ms", int((time.perf_counter() - waited) * 1000))
+        try:
+            yield
+        finally:
+            fcntl.flock(slot_file, fcntl.LOCK_UN)
+            slot_file.close()
+
+
+_slots = {}
+
+
+def get_call_slots(slot_dir=None):
+    slot_dir = str(slot_dir or os.environ[SLOT_DIR_ENV_VAR])
+    if slot_dir not in _slots:
+        _slots[slot_dir] = CallSlots(slot_dir)
+    return _slots[slot_dir]
+
+
+def model_call_slot():
+    """A slot from the LLM_SLOT_DIR pool, or no limit outside a pool."""
+    if not os.environ.get(SLOT_DIR_ENV_VAR):
+        return nullcontext()
+    return get_call_slots().slot()
@@ -0,0 +1,211 @@
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+
+# Rough chars-per-token ratio for English prose; good enough for budgeting.
+CHARS_PER_TOKEN = 4
+
+DEFAULT_CHUNK_TOKENS = 12000
+
+CONCURRENCY_ENV_VAR = "LLM_MAX_CONCURRENCY"
+DEFAULT_CONCURRENCY = 4
+
+SECTIONS = ["goals", "bmps", "implementation", "monitoring", "outreach", "geographicAreas"]
+
+# Field used to recognise the same entry reported by two chunks.
+DEDUPE_KEYS = {
+    "goals": "title",
+    "bmps": "title",
+    "implementation": "activity",
+    "monitoring": "metricName",
+    "outreach": "activity",
+    "geographicAreas": "name",
+}
+
+# With content-defined chunking, about one page in this many ends a chunk,
+# once the chunk holds at least ANCHOR_MIN_FILL of the token budget. A high
+# floor keeps first-run chunks (and prompt repeats) close to the minimum.
+ANCHOR_DIVISOR = 4
+ANCHOR_MIN_FILL = 0.75
+
+# Numbered headings ("3.2 Monitoring"), "Section 4"/"Chapter 2", or short ALL-CAPS lines.
+_HEADING_RE = re.compile(
+    r"^\s*(?:\d+(?:\.\d+)*\.?\s+[A-Z]|(?i:section|chapter|appendix)\s+\w+|[A-Z][A-Z0-9 ,&/()-]{3,60}$)"
+)
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+# ---------- Splitting ----------
+def _split_sections(text):
+    """Break a page into blocks at blank lines and heading lines."""
+    blocks, current = [], []
+    for line in text.splitlines():
+        starts_section = not line.strip() or _HEADING_RE.match(line)
+        if starts_section and current:
+            blocks.append("\n".join(current))
+            current = []
+        if line.strip():
+            current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _split_oversized(block, max_chars):
+    # Last resort for a single block larger than the budget: cut on lines.
+    pieces, current, size = [], [], 0
+    for line in block.splitlines():
+        while len(line) > max_chars:
+            if current:
+                pieces.append("\n".join(current))
+                current, size = [], 0
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if size + len(line) + 1 > max_chars and current:
+            pieces.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def _is_anchor(unit):
+    digest = hashlib.sha256(re.sub(r"\s+", " ", unit).strip().encode("utf-8")).digest()
+    return digest[0] % ANCHOR_DIVISOR == 0
+
+
+def split_into_chunks(pages, max_tokens=DEFAULT_CHUNK_TOKENS, content_defined=False):
+    """Pack page texts into chunks under ``max_tokens``.
+
+    Whole pages are kept together where possible; a page that does not fit is
+    split on section boundaries, and a section that does not fit on lines.
+    ``pages`` may also be a single string, treated as one page.
+
+    With ``content_defined``, a chunk past ``ANCHOR_MIN_FILL`` of the budget
+    also ends after any page whose text hash marks it as an anchor, so boundaries
+    depend on page content rather than position: editing, inserting or
+    removing a page changes only the chunk(s) around it, and the other
+    chunks of a revised document come out byte-identical (and hit the
+    per-chunk cache).
+    """
+    if isinstance(pages, str):
+        pages = [pages]
+    max_chars = max_tokens * CHARS_PER_TOKEN
+
+    units = []
+    for page in pages:
+        if not page or not page.strip():
+            continue
+        if len(page) <= max_chars:
+            units.append(page)
+            continue
+        for block in _split_sections(page):
+            units.extend(_split_oversized(block, max_chars) if len(block) > max_chars else [block])
+
+    chunks, current, size = [], [], 0
+    for unit in units:
+        if current and size + len(unit) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(unit)
+        size += len(unit) + 1
+        if content_defined and size >= max_chars * ANCHOR_MIN_FILL and _is_anchor(unit):
+            chunks.append("\n".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+# ---------- Merging ----------
+def normalise_key(value):
+    return re.sub(r"\s+", " ", str(value)).strip().lower()
+
+
+def _merge_section(section, chunk_items):
+    key_field = DEDUPE_KEYS[section]
+    merged, index = [], {}
+    for items in chunk_items:
+        for item in items or []:
+            key = item.get(key_field)
+            if key is None or not str(key).strip():
+                merged.append(dict(item))
+                continue
+            key = normalise_key(key)
+            if key not in index:
+                index[key] = len(merged)
+                merged.append(dict(item))
+                continue
+            # Same entry seen in an earlier chunk: fill in whatever it was missing.
+            existing = merged[index[key]]
+            for field, value in item.items():
+                if existing.get(field) in (None, "") and value not in (None, ""):
+                    existing[field] = value
+    return merged
+
+
+def merge_chunk_results(results):
+    """Combine per-chunk extractions into one report and recompute ``summary``."""
+    results = [r for r in results if r]
+    if len(results) == 1:
+        return results[0]
+
+    merged = {section: _merge_section(section, [r.get(section) for r in results]) for section in SECTIONS}
+
+    # Weight each chunk's completion estimate by how many goals/BMPs it found.
+    weighted, total_weight = 0.0, 0
+    for r in results:
+        rate = (r.get("summary") or {}).get("completionRate")
+        if rate is None:
+            continue
+        weight = len(r.get("goals") or []) + len(r.get("bmps") or [])
+        weighted += rate * weight
+        total_weight += weight
+    if total_weight:
+        completion_rate = round(weighted / total_weight)
+    else:
+        rates = [(r.get("summary") or {}).get("completionRate") for r in results]
+        rates = [rate for rate in rates if rate is not None]
+        completion_rate = round(sum(rates) / len(rates)) if rates else 0
+
+    merged["summary"] = {
+        "totalGoals": len(merged["goals"]),
+        "totalBMPs": len(merged["bmps"]),
+        "completionRate": completion_rate,
+    }
+    return merged
+
+
+# ---------- Map-reduce driver ----------
+def default_concurrency():
+    return max(1, int(os.environ.get(CONCURRENCY_ENV_VAR, DEFAULT_CONCURRENCY)))
+
+
+def extract_chunked(pages, extract_chunk, max_tokens=DEFAULT_CHUNK_TOKENS, max_workers=None,
+                    content_defined=False):
+    """Run ``extract_chunk(chunk_text) -> dict`` over every chunk concurrently and merge.
+
+    Any exception raised for a chunk propagates, so callers keep their
+    existing error handling for a failed model call. ``content_defined`` is
+    passed to split_into_chunks (use it when chunk results are cached).
+    """
+    chunks = split_into_chunks(pages, max_tokens=max_tokens, content_defined=content_defined)
+    tracing.count("llm_chunks", max(1, len(chunks)))
+    if not chunks:
+        return extract_chunk("")
+    if len(chunks) == 1:
+        return extract_chunk(chunks[0])
+
+    workers = min(max_workers or default_concurrency(), len(chunks))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(tracing.propagate(extract_chunk), chunks))
+    with tracing.stage("merge"):
+        return merge_chunk_results(results)
@@ -0,0 +1,139 @@
+"""Local JSON data service for frontend/dashboard.
+
+    python dashboard_api.py --port 8050
+
+Serves the dashboard's static files at ``/`` and aggregates at:
+
+- ``/api/summary``: report count and item counts per section
+- ``/api/goal-status``: goal status distribution
+- ``/api/metric-targets``: monitoring target vs achieved per metric
+- ``/api/bmp-categories``: BMP count, quantity and cost per category
+
+Aggregates come from the per-report ``rollups`` documents (see rollups.py),
+re-read incrementally at most once per ``--ttl`` seconds. Responses carry an
+ETag, and ``If-None-Match`` requests for unchanged data get 304 responses.
+"""
+import argparse
+import hashlib
+import json
+import sys
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import firebase_database
+import rollups
+
+DASHBOARD_DIR = Path(__file__).resolve().parent / "frontend" / "dashboard"
+DEFAULT_TTL = 30.0
+DEFAULT_LIMIT = 20
+
+
+def _limit(params):
+    return int(params.get("limit", DEFAULT_LIMIT))
+
+
+def summary_view(agg, params):
+    return {"reports": agg["reports"], "counts": agg["counts"]}
+
+
+def goal_status_view(agg, params):
+    return {"labels": list(agg["goalStatus"]), "values": list(agg["goalStatus"].values())}
+
+
+def metric_targets_view(agg, params):
+    rows = sorted(agg["metrics"].items(), key=lambda kv: kv[1]["target"], reverse=True)[:_limit(params)]
+    return {
+        "labels": [name for name, _ in rows],
+        "target": [entry["target"] for _, entry in rows],
+        "achieved": [entry["achieved"] for _, entry in rows],
+    }
+
+
+def bmp_categories_view(agg, params):
+    rows = sorted(agg["bmpCategories"].items(), key=lambda kv: kv[1]["cost"], reverse=True)[:_limit(params)]
+    return {
+        "labels": [name for name, _ in rows],
+        "count": [entry["count"] for _, entry in rows],
+        "quantity": [entry["quantity"] for _, entry in rows],
+        "cost": [entry["cost"] for _, entry in rows],
+    }
+
+
+VIEWS = {
+    "/api/summary": summary_view,
+    "/api/goal-status": goal_status_view,
+    "/api/metric-targets": metric_targets_view,
+    "/api/bmp-categories": bmp_categories_view,
+}
+
+
+class AggregateCache:
+    """TTL cache of rendered responses, invalidated when the rollups change."""
+
+    def __init__(self, index, ttl=DEFAULT_TTL):
+        self.index = index
+        self.ttl = ttl
+        self._checked = 0.0
+        self._responses = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, params):
+        with self._lock:
+            if time.monotonic() - self._checked > self.ttl:
+                if self.index.refresh():
+                    self._responses.clear()
+                self._checked = time.monotonic()
+            key = (path, tuple(sorted(params.items())))
+            if key not in self._responses:
+                body = json.dumps(VIEWS[path](self.index.aggregate(), params)).encode("utf-8")
+                self._responses[key] = (body, f'"{hashlib.sha1(body).hexdigest()}"')
+            return self._responses[key]
+
+
+class DashboardHandler(SimpleHTTPRequestHandler):
+    cache = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path not in VIEWS:
+            return super().do_GET()
+
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body, etag = self.cache.get(url.path, params)
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL, help="seconds between rollup refreshes")
+    parser.add_argument("--secrets", help='secrets source: "env", "file:<path>" or "streamlit" (see settings.py)')
+    args = parser.parse_args(argv)
+
+    firebase_database.configure(args.secrets)
+    DashboardHandler.cache = AggregateCache(rollups.RollupIndex(firebase_database.get_db()), ttl=args.ttl)
+    handler = partial(DashboardHandler, directory=str(DASHBOARD_DIR))
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    print(f"Dashboard on http://{args.host}:{args.port}/", file=sys.stderr)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+CACHE_DIR_ENV_VAR = "EXTRACTION_CACHE_DIR"
+MAX_BYTES_ENV_VAR = "EXTRACTION_CACHE_MAX_BYTES"
+
+DEFAULT_CACHE_DIR = ".cache/extractions"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Other processes may write to the same directory, so the running size
+# estimate is re-synced from a directory scan at least this often.
+RESCAN_SECONDS = 60
+# Eviction frees down to this fraction of the limits, so a full cache is not
+# rescanned on every write.
+EVICT_TO_FRACTION = 0.9
+
+
+class ExtractionCache:
+    """Persistent content-addressed cache of structured extraction results.
+
+    Entries are JSON files named by their key. Each hit refreshes the file's
+    mtime, so evicting oldest-mtime first gives LRU order once the cache grows
+    past ``max_bytes`` (or ``max_entries``, if set). Writes keep a running
+    total; the directory is only scanned once that total crosses a limit or
+    every ``RESCAN_SECONDS``.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_entries=None):
+        self.cache_dir = Path(cache_dir or os.environ.get(CACHE_DIR_ENV_VAR, DEFAULT_CACHE_DIR))
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes or int(os.environ.get(MAX_BYTES_ENV_VAR, DEFAULT_MAX_BYTES))
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Estimated size and entry count; None until the first scan.
+        self._bytes = None
+        self._count = None
+        self._scanned_at = 0.0
+
+    @staticmethod
+    def make_key(pdf_bytes, prompt_template, json_schema, model_name, options=None):
+        return ExtractionCache.make_key_from_hash(
+            hashlib.sha256(pdf_bytes).hexdigest(), prompt_template, json_schema, model_name, options
+        )
+
+    @staticmethod
+    def make_key_from_hash(pdf_sha256, prompt_template, json_schema, model_name, options=None):
+        """``options``: any other settings that change the result (a JSON-able dict)."""
+        digest = hashlib.sha256()
+        parts = [pdf_sha256, prompt_template, json.dumps(json_schema, sort_keys=True), model_name]
+        if options:
+            parts.append(json.dumps(options, sort_keys=True))
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        size = tmp_path.stat().st_size
+        try:
+            replaced = path.stat().st_size
+        except OSError:
+            replaced = None
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += size - (replaced or 0)
+                self._count += replaced is None
+            if not self._over_limit() and time.monotonic() - self._scanned_at < RESCAN_SECONDS:
+                return
+        self._evict()
+
+    def _over_limit(self):
+        return self._bytes is None or self._bytes > self.max_bytes or (
+            self.max_entries is not None and self._count > self.max_entries
+        )
+
+    def _entries(self):
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes or (self.max_entries is not None and len(entries) > self.max_entries):
+            max_bytes = self.max_bytes * EVICT_TO_FRACTION
+            max_entries = None if self.max_entries is None else int(self.max_entries * EVICT_TO_FRACTION)
+        else:
+            max_bytes, max_entries = self.max_bytes, self.max_entries
+        while entries and (
+            total > max_bytes
+            or (max_entries is not None and len(entries) > max_entries)
+        ):
+            _, size, path = entries.pop(0)
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            total -= size
+        with self._lock:
+            self._bytes, self._count = total, len(entries)
+            self._scanned_at = time.monotonic()
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        with self._lock:
+            self._bytes, self._count = 0, 0
+
+    def stats(self):
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+        }
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ExtractionCache()
+    return _default_cache
@@ -1,102 +1,424 @@
-import pdfplumber
+import functools
+import hashlib
 import json
-import uuid
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials, firestore
-import google.generativeai as genai
-import streamlit as st  # Needed for secrets
+
+_import_started = time.perf_counter()
+
+import call_slots
+import chunked_extraction
+import extraction_cache
+import firestore_bulk
+import incremental_extraction
+import pdf_backends
+import pdf_extraction
+import pdf_ocr
+import prompt_compaction
+import retries
+import rollups
+import section_routing
+import settings
+import tracing
+
+MODEL_NAME = "gemini-1.5-flash-latest"
+
+# Clients are created on first use and shared by every thread in the process,
+# so importing this module costs nothing and never touches credentials.
+# firebase_admin/google.generativeai are imported lazily for the same reason.
+_secrets_source = None
+_clients_lock = threading.Lock()
+_db = None
+_model = None
+# Timestamp written into rollups: Firestore's commit-time SERVER_TIMESTAMP
+# once the real client exists (pre-built clients keep the client clock).
+_rollup_timestamp = None
+
+# Seconds spent importing this module and creating each client (first call).
+INIT_TIMINGS = {}
+
+
+def configure(secrets_source=None):
+    """Select the secrets source (see settings.py) and drop any existing clients."""
+    global _secrets_source, _db, _model
+    with _clients_lock:
+        _secrets_source = secrets_source
+        _db = None
+        _model = None
+
+
+def use_clients(db=None, model=None):
+    """Install pre-built clients (e.g. the offline fakes in benchmarks/)."""
+    global _db, _model
+    with _clients_lock:
+        if db is not None:
+            _db = db
+        if model is not None:
+            _model = model
+
 
 # -------- Firestore Initialization --------
-if not firebase_admin._apps:
-    cred = credentials.Certificate(dict(st.secrets["firebase"]))
-    firebase_admin.initialize_app(cred)
-db = firestore.client()
+def get_db():
+    global _db, _rollup_timestamp
+    if _db is None:
+        with _clients_lock:
+            if _db is None:
+                started = time.perf_counter()
+                import firebase_admin
+                from firebase_admin import credentials, firestore
+
+                if not firebase_admin._apps:
+                    secrets = settings.load_secrets(_secrets_source)
+                    cred = credentials.Certificate(dict(secrets["firebase"]))
+                    firebase_admin.initialize_app(cred)
+                _db = firestore.client()
+                _rollup_timestamp = firestore.SERVER_TIMESTAMP
+                INIT_TIMINGS["firestore"] = time.perf_counter() - started
+    return _db
+
 
 # -------- Gemini API Setup --------
-try:
-    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
-except KeyError:
-    raise RuntimeError("API key not found in Streamlit secrets under 'GOOGLE_API_KEY'")
+def get_model():
+    global _model
+    if _model is None:
+        with _clients_lock:
+            if _model is None:
+                started = time.perf_counter()
+                import google.generativeai as genai
+
+                try:
+                    genai.configure(api_key=settings.load_secrets(_secrets_source)["GOOGLE_API_KEY"])
+                except KeyError:
+                    raise RuntimeError("API key not found in secrets under 'GOOGLE_API_KEY'")
+                _model = genai.GenerativeModel(MODEL_NAME)
+                INIT_TIMINGS["model"] = time.perf_counter() - started
+    return _model
 
-model = genai.GenerativeModel("gemini-1.5-flash-latest")
+
+def __getattr__(name):
+    # Keep `firebase_database.db` / `.model` working for existing callers.
+    if name == "db":
+        return get_db()
+    if name == "model":
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # ---------- Helper: Load JSON schema ----------
-def get_json_schema():
-    with open("schema.json", "r", encoding="utf-8") as f:
+@functools.lru_cache(maxsize=None)
+def get_json_schema(path="schema.json"):
+    with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 # ---------- Helper: Load Prompt Template ----------
-def get_prompt_template():
-    with open("prompt.txt", "r", encoding="utf-8") as f:
+@functools.lru_cache(maxsize=None)
+def get_prompt_template(path="prompt.txt"):
+    with open(path, "r", encoding="utf-8") as f:
         return f.read()
         
-def extract_text_from_pdf(pdf_file):
-    text_output = ""
+def extract_text_from_pdf(pdf_file, max_workers=None):
     try:
-        with pdfplumber.open(pdf_file) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text_output += page_text + "\n"
+        return pdf_extraction.extract_text_from_pdf(pdf_file, max_workers=max_workers)
     except Exception as e:
         raise RuntimeError(f"Failed to read PDF: {e}")
-    return text_output
+
+
+def _generate_content(prompt, **kwargs):
+    # Inside a job-queue pool, at most LLM_MAX_CONCURRENCY calls are in flight
+    # across all workers (see call_slots); a retry waits for a slot again.
+    with call_slots.model_call_slot():
+        return get_model().generate_content(prompt, **kwargs)
 
 
 def generate_structured_data(pdf_text, json_schema, prompt_template):
     prompt = prompt_template.format(pdf_text=pdf_text)
-    response = model.generate_content(
-        prompt,
-        generation_config={
-            "response_mime_type": "application/json",
-            "response_schema": json_schema,
-        },
+    with tracing.stage("llm_call"):
+        response = retries.call_with_retries(
+            _generate_content,
+            prompt,
+            generation_config={
+                "response_mime_type": "application/json",
+                "response_schema": json_schema,
+            },
+        )
+    tracing.record_usage(response)
+    with tracing.stage("json_parse"):
+        return json.loads(response.text)
+
+
+def generate_structured_data_chunked(page_texts, json_schema, prompt_template,
+                                     max_chunk_tokens=chunked_extraction.DEFAULT_CHUNK_TOKENS,
+                                     max_workers=None, chunk_cache=None, refresh=False):
+    """Map-reduce variant of generate_structured_data for long documents: the
+    pages are split into chunks under a token budget, extracted concurrently
+    and merged (deduplicated, summary recomputed).
+
+    With ``chunk_cache``, chunk boundaries are content-defined and each
+    chunk's result is cached, so unchanged parts of a revised document are
+    not sent to the model again (``refresh`` re-extracts and replaces them)."""
+    extract = lambda chunk: generate_structured_data(chunk, json_schema, prompt_template)
+    if chunk_cache is not None:
+        extract = incremental_extraction.cached_extract(extract, chunk_cache, prompt_template, json_schema, MODEL_NAME,
+                                                        refresh=refresh)
+    return chunked_extraction.extract_chunked(
+        page_texts,
+        extract,
+        max_tokens=max_chunk_tokens,
+        max_workers=max_workers,
+        content_defined=chunk_cache is not None,
+    )
+
+
+def generate_structured_data_routed(page_texts, json_schema, prompt_template,
+                                    max_chunk_tokens=chunked_extraction.DEFAULT_CHUNK_TOKENS,
+                                    max_workers=None, chunk_cache=None, refresh=False):
+    """Per-section variant of generate_structured_data_chunked: each schema
+    section is extracted, concurrently, from only the pages a TF-IDF index
+    finds relevant to it, with a sub-schema of just that section."""
+    extract = lambda text, sections: generate_structured_data(
+        text, section_routing.sub_schema(json_schema, sections), prompt_template
     )
-    return json.loads(response.text)
+    if chunk_cache is not None:
+        extract = incremental_extraction.cached_extract(extract, chunk_cache, prompt_template, json_schema, MODEL_NAME,
+                                                        refresh=refresh)
+    return section_routing.extract_routed(
+        page_texts,
+        extract,
+        max_tokens=max_chunk_tokens,
+        max_workers=max_workers,
+        content_defined=chunk_cache is not None,
+    )
+
+
+def pipeline_options():
+    """Settings besides prompt, schema and model that change the extracted report."""
+    return {
+        "routing": section_routing.routing_enabled(),
+        "ocr": pdf_extraction.ocr_enabled(),
+        "ocrDpi": pdf_ocr.default_dpi(),
+        "ocrLang": os.environ.get(pdf_ocr.OCR_LANG_ENV_VAR, pdf_ocr.DEFAULT_LANG),
+        "backend": pdf_backends.default_backend(),
+        "chunkTokens": chunked_extraction.DEFAULT_CHUNK_TOKENS,
+    }
+
+
+def extraction_cache_key(pdf_file, json_schema, prompt_template):
+    return extraction_cache.ExtractionCache.make_key_from_hash(
+        pdf_extraction.file_sha256(pdf_file), prompt_template, json_schema, MODEL_NAME, pipeline_options()
+    )
+
+
+def extract_structured_data(pdf_file, json_schema, prompt_template, cache=None, file_name=None, chunk_cache=None,
+                            refresh=False, cache_key=None):
+    """PDF -> structured JSON, served from the on-disk cache when the same
+    PDF bytes, prompt, schema, model and pipeline_options() have been
+    processed before (``cache_key`` may be passed in if already computed).
+
+    Otherwise only chunks not seen before go to the model (see
+    incremental_extraction); with ``file_name``, the page fingerprints of
+    this version are recorded and the changed pages counted on the trace
+    (telemetry only).
+    ``refresh`` skips both caches and replaces their entries."""
+    cache = cache or extraction_cache.get_default_cache()
+    chunk_cache = chunk_cache or incremental_extraction.get_chunk_cache()
+    key = cache_key or extraction_cache_key(pdf_file, json_schema, prompt_template)
+    cached = None if refresh else cache.get(key)
+    if cached is not None:
+        tracing.count("cache_hits")
+        return cached
+
+    try:
+        page_texts = pdf_extraction.extract_pages(pdf_file)
+    except Exception as e:
+        raise RuntimeError(f"Failed to read PDF: {e}")
+    # Running headers/footers, TOC pages and whitespace cost tokens, not content.
+    page_texts, _ = prompt_compaction.compact_pages(page_texts)
+    if file_name:
+        incremental_extraction.get_page_manifests().update(file_name, page_texts)
+    if section_routing.routing_enabled():
+        structured_data = generate_structured_data_routed(page_texts, json_schema, prompt_template,
+                                                          chunk_cache=chunk_cache, refresh=refresh)
+    else:
+        structured_data = generate_structured_data_chunked(page_texts, json_schema, prompt_template,
+                                                           chunk_cache=chunk_cache, refresh=refresh)
+    cache.put(key, structured_data)
+    return structured_data
+
+
+SECTIONS = ["goals", "bmps", "implementation", "monitoring", "outreach", "geographicAreas"]
 
 
 def delete_existing_docs(collection_name, file_name):
-    coll_ref = db.collection(collection_name)
-    docs = coll_ref.where("sourceFileName", "==", file_name).stream()
-    batch = db.batch()
-    count = 0
-    for doc in docs:
-        batch.delete(doc.reference)
-        count += 1
-        if count % 500 == 0:
-            batch.commit()
-            batch = db.batch()
-    batch.commit()
-
-
-def upload_data_normalized(file_name, summary, structured_data):
-    # Delete previous summary doc for this file
-    db.collection("summaries").document(file_name).delete()
-
-    # Delete previous docs in all sections for this file
-    sections = ["goals", "bmps", "implementation", "monitoring", "outreach", "geographicAreas"]
-    for section in sections:
-        delete_existing_docs(section, file_name)
-
-    # Upload summary doc
-    db.collection("summaries").document(file_name).set({
-        "sourceFileName": file_name,
-        "createdAt": datetime.utcnow(),
-        **summary
-    })
-
-    # Upload section documents
-    for section in sections:
-        coll_ref = db.collection(section)
-        batch = db.batch()
-        for item in structured_data.get(section, []):
-            doc_id = item.get("id") or str(uuid.uuid4())
-            doc_ref = coll_ref.document(doc_id)
-            batch.set(doc_ref, {
-                **item,
+    db = get_db()
+    with firestore_bulk.BulkWriter(db) as writer:
+        firestore_bulk.delete_where(writer, [db.collection(collection_name)], "sourceFileName", file_name)
+    return writer.stats()
+
+
+def upload_data_normalized(file_name, summary, structured_data, max_workers=firestore_bulk.DEFAULT_MAX_WORKERS):
+    """Replace all docs for ``file_name`` and return write statistics.
+
+    Deletes for every section run concurrently and finish before any writes
+    start (items map to the same IDs as before); writes are then committed
+    as concurrent batches of at most 500 operations.
+    """
+    with tracing.stage("firestore_upload"):
+        return _upload_data_normalized(file_name, summary, structured_data, max_workers)
+
+
+def _upload_data_normalized(file_name, summary, structured_data, max_workers):
+    db = get_db()
+    with firestore_bulk.BulkWriter(db, max_workers=max_workers) as deleter:
+        # Delete previous summary doc and section docs for this file
+        deleter.delete(db.collection("summaries").document(file_name))
+        firestore_bulk.delete_where(
+            deleter, [db.collection(section) for section in SECTIONS],
+            "sourceFileName", file_name, max_workers=max_workers,
+        )
+
+    created_at = datetime.utcnow()
+    with firestore_bulk.BulkWriter(db, max_workers=max_workers) as writer:
+        # Upload summary doc
+        writer.set(db.collection("summaries").document(file_name), {
+            "sourceFileName": file_name,
+            "createdAt": created_at,
+            **summary
+        })
+
+        # Upload section documents
+        for section in SECTIONS:
+            coll_ref = db.collection(section)
+            items = structured_data.get(section, [])
+            for doc_id, item in zip(stable_doc_ids(file_name, section, items), items):
+                writer.set(coll_ref.document(doc_id), {
+                    **item,
+                    "sourceFileName": file_name,
+                    "createdAt": created_at
+                })
+
+        # Dashboard aggregates read this instead of scanning the sections.
+        writer.set(db.collection(rollups.ROLLUP_COLLECTION).document(file_name),
+                   rollups.rollup_document(file_name, structured_data, _rollup_timestamp))
+
+    delete_stats, write_stats = deleter.stats(), writer.stats()
+    return {
+        "deleted": delete_stats["operations"],
+        "written": write_stats["operations"],
+        "retries": delete_stats["retries"] + write_stats["retries"],
+        "seconds": delete_stats["seconds"] + write_stats["seconds"],
+        "docsPerSecond": write_stats["docsPerSecond"],
+    }
+
+
+# ---------- Incremental sync ----------
+def content_hash(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def stable_doc_ids(file_name, section, items):
+    """Content-derived doc IDs: the same entry (by its model-supplied ``id``,
+    else its title/activity/metricName/name) in a re-processed report maps to
+    the same document. IDs are always scoped to ``file_name``, since every
+    report shares the section collections."""
+    key_field = chunked_extraction.DEDUPE_KEYS[section]
+    seen = {}
+    ids = []
+    for item in items:
+        key = item.get(key_field)
+        if item.get("id"):
+            identity = f"id\0{item['id']}"
+        elif key:
+            identity = chunked_extraction.normalise_key(key)
+        else:
+            identity = content_hash(item)
+        # Repeated keys within one report get an occurrence suffix.
+        occurrence = seen.get(identity, 0)
+        seen[identity] = occurrence + 1
+        raw = f"{file_name}\0{section}\0{identity}\0{occurrence}"
+        ids.append(hashlib.sha1(raw.encode("utf-8")).hexdigest())
+    return ids
+
+
+def _has_changes(changes):
+    return any(counts["added"] or counts["changed"] or counts["removed"] for counts in changes.values())
+
+
+def _existing_hashes(section, file_name):
+    db = get_db()
+    query = db.collection(section).where("sourceFileName", "==", file_name).select(["contentHash", "createdAt"])
+    existing = {doc.id: doc.to_dict() for doc in query.stream()}
+    tracing.count("firestore_reads", len(existing))
+    return existing
+
+
+def sync_data_incremental(file_name, summary, structured_data, max_workers=firestore_bulk.DEFAULT_MAX_WORKERS):
+    """Upsert a report, writing only added/changed items and deleting removed ones.
+
+    Existing docs for the file are read once per section (content hashes
+    only); unchanged items cost no writes. Returns per-section counts of
+    added/changed/removed/unchanged items plus write statistics.
+    """
+    with tracing.stage("firestore_upload"):
+        return _sync_data_incremental(file_name, summary, structured_data, max_workers)
+
+
+def _sync_data_incremental(file_name, summary, structured_data, max_workers):
+    db = get_db()
+    now = datetime.utcnow()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        existing_by_section = dict(zip(
+            SECTIONS, pool.map(tracing.propagate(lambda s: _existing_hashes(s, file_name)), SECTIONS)
+        ))
+        summary_doc = db.collection("summaries").document(file_name).get()
+
+    changes = {}
+    with firestore_bulk.BulkWriter(db, max_workers=max_workers) as writer:
+        summary_hash = content_hash(summary)
+        existing_summary = summary_doc.to_dict() if summary_doc.exists else None
+        if not existing_summary or existing_summary.get("contentHash") != summary_hash:
+            writer.set(db.collection("summaries").document(file_name), {
                 "sourceFileName": file_name,
-                "createdAt": datetime.utcnow()
+                "createdAt": (existing_summary or {}).get("createdAt", now),
+                "updatedAt": now,
+                "contentHash": summary_hash,
+                **summary
             })
-        batch.commit()
+
+        for section in SECTIONS:
+            coll_ref = db.collection(section)
+            existing = existing_by_section[section]
+            items = structured_data.get(section, [])
+            counts = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+
+            for doc_id, item in zip(stable_doc_ids(file_name, section, items), items):
+                item_hash = content_hash(item)
+                previous = existing.pop(doc_id, None)
+                if previous is not None and previous.get("contentHash") == item_hash:
+                    counts["unchanged"] += 1
+                    continue
+                counts["changed" if previous is not None else "added"] += 1
+                writer.set(coll_ref.document(doc_id), {
+                    **item,
+                    "sourceFileName": file_name,
+                    "createdAt": (previous or {}).get("createdAt", now),
+                    "updatedAt": now,
+                    "contentHash": item_hash,
+                })
+
+            # Whatever is left over is no longer in the report.
+            for doc_id in existing:
+                writer.delete(coll_ref.document(doc_id))
+                counts["removed"] += 1
+            changes[section] = counts
+
+        if _has_changes(changes) or existing_summary is None:
+            writer.set(db.collection(rollups.ROLLUP_COLLECTION).document(file_name),
+                       rollups.rollup_document(file_name, structured_data, _rollup_timestamp))
+
+    return {"sections": changes, **writer.stats()}
+
+
+INIT_TIMINGS["import"] = time.perf_counter() - _import_started
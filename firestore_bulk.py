@@ -0,0 +1,141 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import retries
+import tracing
+
+# Firestore rejects a WriteBatch with more than 500 operations.
+FIRESTORE_BATCH_LIMIT = 500
+
+DEFAULT_MAX_WORKERS = 8
+
+# ABORTED (409) is what Firestore returns for contended commits.
+CONTENTION_STATUS_CODES = {409}
+
+
+def is_retryable_commit(exc):
+    code = getattr(exc, "code", None)
+    if isinstance(code, int) and code in CONTENTION_STATUS_CODES:
+        return True
+    return retries.is_retryable(exc)
+
+
+class BulkWriter:
+    """Queue set/delete operations and commit them as concurrent batches.
+
+    Operations are grouped into batches of at most ``batch_size``; each full
+    batch is committed on a bounded thread pool while more operations are
+    queued. Failed commits are retried with backoff, rebuilding the batch
+    each attempt. Use as a context manager, or call ``flush()``/``close()``.
+    """
+
+    def __init__(self, db, max_workers=DEFAULT_MAX_WORKERS, batch_size=FIRESTORE_BATCH_LIMIT,
+                 max_attempts=retries.DEFAULT_MAX_ATTEMPTS):
+        self.db = db
+        self.batch_size = min(batch_size, FIRESTORE_BATCH_LIMIT)
+        self.max_attempts = max_attempts
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._pending = []
+        self._futures = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.operations = 0
+        self.batches = 0
+        self.retries = 0
+
+    # ---------- Queueing ----------
+    def set(self, doc_ref, data):
+        self._add(("set", doc_ref, data))
+
+    def delete(self, doc_ref):
+        self._add(("delete", doc_ref, None))
+
+    def _add(self, op):
+        self._pending.append(op)
+        if len(self._pending) >= self.batch_size:
+            self._submit()
+
+    def _submit(self):
+        ops, self._pending = self._pending, []
+        if ops:
+            self._futures.append(self._pool.submit(tracing.propagate(self._commit_with_retries), ops))
+
+    # ---------- Committing ----------
+    def _commit_with_retries(self, ops):
+        attempts = 0
+
+        def commit():
+            nonlocal attempts
+            attempts += 1
+            batch = self.db.batch()
+            for kind, doc_ref, data in ops:
+                if kind == "set":
+                    batch.set(doc_ref, data)
+                else:
+                    batch.delete(doc_ref)
+            batch.commit()
+
+        try:
+            retries.call_with_retries(
+                commit, max_attempts=self.max_attempts, retryable=is_retryable_commit
+            )
+        finally:
+            with self._lock:
+                self.retries += attempts - 1
+        with self._lock:
+            self.operations += len(ops)
+            self.batches += 1
+        tracing.count("firestore_ops", len(ops))
+        tracing.count("firestore_commits")
+
+    def flush(self):
+        """Commit everything queued so far; re-raise the first failed commit."""
+        self._submit()
+        futures, self._futures = self._futures, []
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._pool.shutdown(cancel_futures=True)
+
+    def stats(self):
+        seconds = time.perf_counter() - self._started
+        return {
+            "operations": self.operations,
+            "batches": self.batches,
+            "retries": self.retries,
+            "seconds": seconds,
+            "docsPerSecond": self.operations / seconds if seconds else 0.0,
+        }
+
+
+def delete_where(writer, collections, field, value, max_workers=DEFAULT_MAX_WORKERS):
+    """Queue deletes for every doc in ``collections`` whose ``field == value``.
+
+    The collections are queried concurrently, projecting just ``field`` so the
+    full documents are never downloaded.
+    """
+    def refs_for(coll_ref):
+        query = coll_ref.where(field, "==", value).select([field])
+        refs = [doc.reference for doc in query.stream()]
+        tracing.count("firestore_reads", len(refs))
+        return refs
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for refs in pool.map(tracing.propagate(refs_for), collections):
+            for doc_ref in refs:
+                writer.delete(doc_ref)
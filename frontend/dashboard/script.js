@@ -1,48 +1,72 @@
-// Bar Chart
-const barCtx = document.getElementById('barChart').getContext('2d');
-new Chart(barCtx, {
-  type: 'bar',
-  data: {
-    labels: ['Irrigation Systems', 'Delivery Lines'],
-    datasets: [
-      {
-        label: 'Target',
-        data: [50000, 150000],
-        backgroundColor: 'rgba(100, 149, 237, 0.7)'
-      },
-      {
-        label: 'Achieved',
-        data: [60000, 280000],
-        backgroundColor: 'rgba(60, 179, 113, 0.7)'
-      }
-    ]
-  },
-  options: {
-    responsive: true,
-    scales: {
-      y: {
-        beginAtZero: true
-      }
-    }
+// Aggregates come from dashboard_api.py. Set window.DASHBOARD_API before this
+// script to point at another host; by default the page's own origin is used.
+const API_BASE = window.DASHBOARD_API || '';
+
+async function fetchJSON(path) {
+  const response = await fetch(API_BASE + path);
+  if (!response.ok) {
+    throw new Error(`${path}: ${response.status}`);
   }
-});
+  return response.json();
+}
+
+const STATUS_COLORS = {
+  'Met': 'rgba(60, 179, 113, 0.8)',
+  'Completed': 'rgba(60, 179, 113, 0.8)',
+  'In Progress': 'rgba(255, 206, 86, 0.8)',
+  'Not Started': 'rgba(220, 53, 69, 0.8)'
+};
 
-// Pie Chart
-const pieCtx = document.getElementById('pieChart').getContext('2d');
-new Chart(pieCtx, {
-  type: 'pie',
-  data: {
-    labels: ['Met', 'In Progress', 'Not Started'],
-    datasets: [{
-      data: [60, 25, 15],
-      backgroundColor: [
-        'rgba(60, 179, 113, 0.8)',
-        'rgba(255, 206, 86, 0.8)',
-        'rgba(220, 53, 69, 0.8)'
+// Bar Chart: monitoring target vs achieved per metric
+async function renderBarChart() {
+  const metrics = await fetchJSON('/api/metric-targets?limit=12');
+  const barCtx = document.getElementById('barChart').getContext('2d');
+  new Chart(barCtx, {
+    type: 'bar',
+    data: {
+      labels: metrics.labels,
+      datasets: [
+        {
+          label: 'Target',
+          data: metrics.target,
+          backgroundColor: 'rgba(100, 149, 237, 0.7)'
+        },
+        {
+          label: 'Achieved',
+          data: metrics.achieved,
+          backgroundColor: 'rgba(60, 179, 113, 0.7)'
+        }
       ]
-    }]
-  },
-  options: {
-    responsive: true
-  }
-});
+    },
+    options: {
+      responsive: true,
+      scales: {
+        y: {
+          beginAtZero: true
+        }
+      }
+    }
+  });
+}
+
+// Pie Chart: goal status distribution
+async function renderPieChart() {
+  const goalStatus = await fetchJSON('/api/goal-status');
+  const pieCtx = document.getElementById('pieChart').getContext('2d');
+  new Chart(pieCtx, {
+    type: 'pie',
+    data: {
+      labels: goalStatus.labels,
+      datasets: [{
+        data: goalStatus.values,
+        backgroundColor: goalStatus.labels.map(label => STATUS_COLORS[label] || 'rgba(150, 150, 150, 0.8)')
+      }]
+    },
+    options: {
+      responsive: true
+    }
+  });
+}
+
+renderBarChart().catch(err => console.error('Bar chart:', err));
+renderPieChart().catch(err => console.error('Pie chart:', err));
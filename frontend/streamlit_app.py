@@ -1,21 +1,49 @@
+import sys
+from pathlib import Path
+
 import streamlit as st
-import pdfplumber
 import json
-import google.generativeai as genai
 import pandas as pd
 
+# Shared pipeline modules live at the repository root.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import extraction_cache
+import job_queue
+import tracing
+
 # ------------------------
-# Gemini API setup
+# Job queue setup
 # ------------------------
-try:
-    # This assumes the API key is set in Streamlit's secrets.toml file.
-    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
-except KeyError:
-    st.error("API key not found. Please add `GOOGLE_API_KEY` to your Streamlit secrets.")
-    st.stop()
+# Extraction runs in job_queue worker processes; this app only enqueues
+# files and polls their jobs, so a refresh or a long batch never loses work.
+@st.cache_resource
+def get_job_queue():
+    return job_queue.JobQueue()
+
+
+queue = get_job_queue()
+
+
+@st.cache_resource
+def start_workers():
+    # Once per server process, unless workers are already running.
+    if queue.live_workers():
+        return []
+    return job_queue.start_workers()
+
+
+start_workers()
 
-# Use the latest available Gemini model for text generation.
-model = genai.GenerativeModel("gemini-1.5-flash-latest")
+
+@st.cache_resource
+def start_metrics_server():
+    # Serves /metrics for the app and the queue's workers when METRICS_PORT
+    # is set, including workers started with `python job_queue.py worker`.
+    job_queue.share_metrics()
+    return tracing.start_metrics_server()
+
+
+start_metrics_server()
 
 # ------------------------
 # Streamlit UI
@@ -30,19 +58,6 @@ uploaded_files = st.file_uploader(
     "Drag and drop PDF files here", type="pdf", accept_multiple_files=True
 )
 
-def extract_text_from_pdf(pdf_file):
-    """Extract text from all pages of a PDF."""
-    text_output = ""
-    try:
-        with pdfplumber.open(pdf_file) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text_output += page_text + "\n"
-    except Exception as e:
-        st.error(f"Failed to read PDF: {e}")
-    return text_output
-
 # Corrected JSON schema to match the detailed interface described in the prompt.
 # This schema is crucial for instructing the Gemini model on the exact output format.
 json_schema = {
@@ -139,155 +154,223 @@ json_schema = {
 }
 
 
+# The prompt is refined to align with the new, more detailed JSON schema.
+# `{pdf_text}` is filled in per file; the template itself is part of the cache key.
+prompt_template = """
+You are a data extraction assistant specialized in agricultural and environmental reports.
+
+Your task is to extract structured data from the input report text and return it as a valid JSON object that strictly follows the defined schema.
+
+---
+
+### 📄 Input Text:
+{pdf_text}
+
+---
+
+### 🧩 JSON Structure (Schema):
+
+Extract the following sections into JSON. Each field is required — include an empty array if no data is found.
+
+- **summary**:
+  - `totalGoals`: Total number of goal activities.
+  - `totalBMPs`: Total number of BMP activities.
+  - `completionRate`: A number between 0–100 representing estimated completion (see calculation rules below).
+
+- **goals**: Array of goal objects.
+  - Each must include:
+    - `title`: Short name of the goal.
+    - `description`: Explanation of the goal’s purpose or intent.
+
+- **bmps**: Array of BMP (Best Management Practice) objects.
+  - Each must include:
+    - `title`: Name of the BMP.
+    - `description`: Description of what it involves.
+    - `category`: Type/classification of the BMP.
+
+- **implementation**: On-the-ground activities that were performed or executed.
+  - Each item must include:
+    - `activity`: Short name of the implementation step.
+    - `description`: Detailed explanation of what was implemented.
+
+- **monitoring**: Activities that track or assess progress by measuring specific indicators.
+  - Each item must include:
+    - `metricName`: Name of the metric being measured (e.g., "Water pH", "Soil Moisture").
+    - `value`: The measured value or status of the metric (can be numeric or descriptive).
+    - `units`: Units of the metric if applicable (e.g., "mg/L", "%", "count").
+    - `description`: Explanation of what the metric represents and how it was obtained.
+
+
+- **outreach**: Community engagement or communication activities.
+  - Each must include:
+    - `activity`: Name of the outreach effort.
+    - `description`: Who was engaged and what was shared.
+
+- **geographicAreas**: Locations relevant to the report.
+  - Each must include:
+    - `name`: Name of the area.
+    - `description`: Details about its relevance.
+
+---
+
+For the `completionRate`, carefully analyze the entire input text for mentions of completed goal activities, BMP implementations, milestones, or progress statements.
+
+- Estimate the overall completion as a numeric percentage (0–100) reflecting the progress toward fulfilling all stated goals and BMPs.
+- Consider both explicit quantitative data (e.g., "70% complete") and qualitative descriptions indicating progress (e.g., "most activities have been finished", "implementation ongoing").
+- Use your best judgment to infer the level of completion even if exact figures are not provided.
+- Return **only** a single numeric value between 0 and 100, rounded to the nearest integer. No text, ranges, or explanations.
+- If no progress information is found, default to 0.
+
+⚠️ Do **not** calculate the completion rate by a fixed formula or ratio of counts but use your LLM reasoning to estimate overall progress based on the report content.
+
+
+---
+
+### ✅ Output Instructions
+
+- Output **only** a valid JSON object.
+- All required fields must be included.
+- If no entries exist in a category, use an empty array.
+- Follow the schema strictly.
+
+Begin extraction now.
+"""
+
+
+def render_structured_data(uploaded_file, structured_data):
+    st.subheader("ExtractedReport JSON")
+    st.json(structured_data)
+
+    # ------------------------
+    # Statistical Dashboard
+    # ------------------------
+    if structured_data and "summary" in structured_data:
+        st.subheader("Step 3️⃣ - Statistical Dashboard")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric(label="Total Goals", value=structured_data["summary"]["totalGoals"])
+        with col2:
+            st.metric(label="Total BMPs", value=structured_data["summary"]["totalBMPs"])
+        with col3:
+            st.metric(label="Completion Rate", value=f'{structured_data["summary"]["completionRate"]}%')
+
+        # Create a bar chart for categorical data
+        st.markdown("### Report Content Breakdown")
+        data_counts = {
+            "Goals": structured_data["summary"]["totalGoals"],
+            "BMPs": structured_data["summary"]["totalBMPs"],
+            "Implementation Activities": len(structured_data.get("implementation", [])),
+            "Monitoring Metrics": len(structured_data.get("monitoring", [])),
+            "Outreach Activities": len(structured_data.get("outreach", [])),
+            "Geographic Areas": len(structured_data.get("geographicAreas", [])),
+        }
+
+        df = pd.DataFrame(data_counts.items(), columns=["Category", "Count"])
+        st.bar_chart(df.set_index("Category"))
+
+    # Download button for the generated JSON file.
+    st.download_button(
+        "📥 Download JSON",
+        data=json.dumps(structured_data, indent=2),
+        file_name=f"{uploaded_file.name.replace('.pdf','')}_ExtractedReport.json",
+        mime="application/json",
+    )
+
+
+def render_details(job):
+    result = job["result"]
+    st.subheader("⏱ Timings")
+    st.dataframe(pd.DataFrame(tracing.timings_table(result["trace"])), hide_index=True)
+    counters = result["trace"]["counters"]
+    st.caption(", ".join(f"{name}: {value}" for name, value in counters.items()))
+    if counters.get("input_tokens_before_compaction"):
+        before = counters["input_tokens_before_compaction"]
+        after = counters.get("input_tokens_after_compaction", 0)
+        st.caption(f"Prompt input: ~{before:,} → ~{after:,} tokens ({100 * (1 - after / before):.0f}% saved)")
+    if result.get("validationErrors"):
+        st.warning("JSON does not fully match schema: "
+                   + "; ".join(m for errors in result["validationErrors"].values() for m in errors))
+
+    st.subheader("Step 1️⃣ - Extract PDF Text")
+    preview = result.get("textPreview")
+    if preview is None:
+        return
+    if not preview["text"].strip():
+        st.warning("No text could be extracted from the uploaded PDF.")
+        return
+    # A bounded preview: the browser never receives the whole text.
+    st.text_area("Raw Extracted Text", preview["text"], height=300, key=f"text-{job['id']}")
+    if preview["truncated"]:
+        st.caption(f"Showing the first {len(preview['text']):,} characters.")
+
+
+@st.fragment(run_every=job_queue.POLL_SECONDS)
+def pending_jobs(job_ids):
+    jobs = [queue.get(job_id) for job_id in job_ids]
+    if any(job["status"] in (job_queue.DONE, job_queue.DEAD) for job in jobs):
+        st.rerun()
+    for job in jobs:
+        st.progress(job["progress"], text=f"`{job['sourceFileName']}`: {job['stage']} "
+                                          f"(attempt {max(job['attempts'], 1)}/{job['maxAttempts']})")
+        if job["error"]:
+            st.caption(f"Last attempt failed: {job['error']}")
+    if not queue.live_workers():
+        st.warning("No extraction worker is running. Start one with `python job_queue.py worker`.")
+
+
+cache = extraction_cache.get_default_cache()
+
+# Extraction job per upload for this session; reruns triggered by other
+# widgets re-render finished jobs instead of losing or recomputing them.
+session_jobs = st.session_state.setdefault("jobs", {})
+
+if st.sidebar.button("Clear cached results"):
+    session_jobs.clear()
+    cache.clear()
+    # The queue would otherwise hand back the finished jobs for the same files.
+    st.session_state["refresh"] = True
+
+upload = st.sidebar.checkbox("Also upload reports to Firestore")
+
+# One cap on in-flight Gemini requests across every queue worker.
+model_call_slots = job_queue.model_call_slots()
+max_concurrency = st.sidebar.number_input(
+    "Max concurrent Gemini requests", min_value=1, max_value=32, value=model_call_slots.limit(),
+)
+if max_concurrency != model_call_slots.limit():
+    model_call_slots.set_limit(max_concurrency)
+
 if uploaded_files:
     if st.button("Extract Structured Data from All Files"):
-        with st.spinner("Processing with Gemini..."):
-            for uploaded_file in uploaded_files:
-                st.markdown(f"### Processing `{uploaded_file.name}`")
-                
-                with st.expander("Show/Hide Processing Details"):
-                    st.subheader("Step 1️⃣ - Extract PDF Text")
-                    pdf_text = extract_text_from_pdf(uploaded_file)
-        
-                    if not pdf_text.strip():
-                        st.warning("No text could be extracted from the uploaded PDF.")
-                    else:
-                        st.text_area("Raw Extracted Text", pdf_text, height=300)
-        
-                        st.subheader("Step 2️⃣ - Generate ExtractedReport JSON")
-        
-                        # The prompt is refined to align with the new, more detailed JSON schema.
-                        prompt = f"""
-                        You are a data extraction assistant specialized in agricultural and environmental reports.
-                        
-                        Your task is to extract structured data from the input report text and return it as a valid JSON object that strictly follows the defined schema.
-                        
-                        ---
-                        
-                        ### 📄 Input Text:
-                        {pdf_text}
-                        
-                        ---
-                        
-                        ### 🧩 JSON Structure (Schema):
-                        
-                        Extract the following sections into JSON. Each field is required — include an empty array if no data is found.
-                        
-                        - **summary**:
-                          - `totalGoals`: Total number of goal activities.
-                          - `totalBMPs`: Total number of BMP activities.
-                          - `completionRate`: A number between 0–100 representing estimated completion (see calculation rules below).
-                        
-                        - **goals**: Array of goal objects.
-                          - Each must include:
-                            - `title`: Short name of the goal.
-                            - `description`: Explanation of the goal’s purpose or intent.
-                        
-                        - **bmps**: Array of BMP (Best Management Practice) objects.
-                          - Each must include:
-                            - `title`: Name of the BMP.
-                            - `description`: Description of what it involves.
-                            - `category`: Type/classification of the BMP.
-                        
-                        - **implementation**: On-the-ground activities that were performed or executed.
-                          - Each item must include:
-                            - `activity`: Short name of the implementation step.
-                            - `description`: Detailed explanation of what was implemented.
-                        
-                        - **monitoring**: Activities that track or assess progress by measuring specific indicators.
-                          - Each item must include:
-                            - `metricName`: Name of the metric being measured (e.g., "Water pH", "Soil Moisture").
-                            - `value`: The measured value or status of the metric (can be numeric or descriptive).
-                            - `units`: Units of the metric if applicable (e.g., "mg/L", "%", "count").
-                            - `description`: Explanation of what the metric represents and how it was obtained.
-
-                        
-                        - **outreach**: Community engagement or communication activities.
-                          - Each must include:
-                            - `activity`: Name of the outreach effort.
-                            - `description`: Who was engaged and what was shared.
-                        
-                        - **geographicAreas**: Locations relevant to the report.
-                          - Each must include:
-                            - `name`: Name of the area.
-                            - `description`: Details about its relevance.
-                        
-                        ---
-                        
-                       For the `completionRate`, carefully analyze the entire input text for mentions of completed goal activities, BMP implementations, milestones, or progress statements.
-
-                        - Estimate the overall completion as a numeric percentage (0–100) reflecting the progress toward fulfilling all stated goals and BMPs.
-                        - Consider both explicit quantitative data (e.g., "70% complete") and qualitative descriptions indicating progress (e.g., "most activities have been finished", "implementation ongoing").
-                        - Use your best judgment to infer the level of completion even if exact figures are not provided.
-                        - Return **only** a single numeric value between 0 and 100, rounded to the nearest integer. No text, ranges, or explanations.
-                        - If no progress information is found, default to 0.
-                        
-                        ⚠️ Do **not** calculate the completion rate by a fixed formula or ratio of counts but use your LLM reasoning to estimate overall progress based on the report content.
-
-                        
-                        ---
-                        
-                        ### ✅ Output Instructions
-                        
-                        - Output **only** a valid JSON object.
-                        - All required fields must be included.
-                        - If no entries exist in a category, use an empty array.
-                        - Follow the schema strictly.
-                        
-                        Begin extraction now.
-                        """
-
-        
-                        try:
-                            response = model.generate_content(
-                                prompt,
-                                generation_config={
-                                    "response_mime_type": "application/json",
-                                    # Use the updated and correct schema.
-                                    "response_schema": json_schema,
-                                },
-                            )
-                            # The response.text property contains the generated JSON string.
-                            structured_data = json.loads(response.text)
-        
-                            st.subheader("ExtractedReport JSON")
-                            st.json(structured_data)
-        
-                            # ------------------------
-                            # Statistical Dashboard
-                            # ------------------------
-                            if structured_data and "summary" in structured_data:
-                                st.subheader("Step 3️⃣ - Statistical Dashboard")
-                                col1, col2, col3 = st.columns(3)
-                                with col1:
-                                    st.metric(label="Total Goals", value=structured_data["summary"]["totalGoals"])
-                                with col2:
-                                    st.metric(label="Total BMPs", value=structured_data["summary"]["totalBMPs"])
-                                with col3:
-                                    st.metric(label="Completion Rate", value=f'{structured_data["summary"]["completionRate"]}%')
-        
-                                # Create a bar chart for categorical data
-                                st.markdown("### Report Content Breakdown")
-                                data_counts = {
-                                    "Goals": structured_data["summary"]["totalGoals"],
-                                    "BMPs": structured_data["summary"]["totalBMPs"],
-                                    "Implementation Activities": len(structured_data.get("implementation", [])),
-                                    "Monitoring Metrics": len(structured_data.get("monitoring", [])),
-                                    "Outreach Activities": len(structured_data.get("outreach", [])),
-                                    "Geographic Areas": len(structured_data.get("geographicAreas", [])),
-                                }
-                                
-                                df = pd.DataFrame(data_counts.items(), columns=["Category", "Count"])
-                                st.bar_chart(df.set_index("Category"))
-        
-                            # Download button for the generated JSON file.
-                            st.download_button(
-                                "📥 Download JSON",
-                                data=json.dumps(structured_data, indent=2),
-                                file_name=f"{uploaded_file.name.replace('.pdf','')}_ExtractedReport.json",
-                                mime="application/json",
-                            )
-                        except json.JSONDecodeError:
-                            st.error("The response could not be parsed as JSON. The Gemini model may have returned an invalid format.")
-                        except Exception as e:
-                            st.error(f"An error occurred: {e}")
+        refresh = st.session_state.pop("refresh", False)
+        for uploaded_file in uploaded_files:
+            # Jobs are keyed by upload, since file names can repeat; the queue
+            # returns the existing job for content it has already extracted.
+            session_jobs[uploaded_file.file_id] = queue.enqueue(
+                uploaded_file, uploaded_file.name, upload=upload, refresh=refresh,
+                prompt_template=prompt_template, json_schema=json_schema,
+            )
+
+    pending = []
+    for uploaded_file in uploaded_files:
+        if uploaded_file.file_id not in session_jobs:
+            continue
+        job = queue.get(session_jobs[uploaded_file.file_id])
+        if job["status"] == job_queue.DONE:
+            st.markdown(f"### `{uploaded_file.name}`")
+            with st.expander("Show/Hide Processing Details"):
+                render_details(job)
+                st.subheader("Step 2️⃣ - Generate ExtractedReport JSON")
+                render_structured_data(uploaded_file, job["result"]["data"])
+        elif job["status"] == job_queue.DEAD:
+            st.markdown(f"### `{uploaded_file.name}`")
+            st.error(f"An error occurred after {job['attempts']} attempts: {job['error']}")
+            if st.button("Retry", key=f"retry-{job['id']}"):
+                queue.retry(job["id"])
+                st.rerun()
+        else:
+            pending.append(job["id"])
+
+    if pending:
+        st.markdown(f"### Processing {len(pending)} file(s) with Gemini...")
+        pending_jobs(pending)
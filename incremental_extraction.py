@@ -0,0 +1,137 @@
+"""Page-level reuse of extraction work across versions of the same plan.
+
+Two pieces:
+
+- ``cached_extract(extract_fn, cache, ...)`` wraps a per-chunk model call
+  so results are stored by the chunk's exact text (plus the requested
+  sections, prompt, schema and model). Combined with content-defined chunk
+  boundaries (``split_into_chunks(..., content_defined=True)``), a revised
+  plan re-sends only the chunks around changed pages.
+- ``PageManifests`` keeps the page fingerprints last seen for every
+  ``sourceFileName`` and reports which pages of a new version are
+  unchanged, changed/added or removed. This is telemetry only (the
+  ``pages_changed``/``pages_unchanged`` trace counters); the chunk cache
+  alone decides what is sent to the model again.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+import extraction_cache
+import tracing
+
+MANIFEST_DIR_ENV_VAR = "PAGE_MANIFEST_DIR"
+DEFAULT_MANIFEST_DIR = ".cache/page_manifests"
+CHUNK_CACHE_DIR_ENV_VAR = "CHUNK_CACHE_DIR"
+DEFAULT_CHUNK_CACHE_DIR = ".cache/chunk_results"
+
+
+def page_fingerprint(text):
+    """Hash of a page's text, insensitive to whitespace differences."""
+    normalized = re.sub(r"\s+", " ", text or "").strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+
+# ---------- Per-chunk result cache ----------
+def chunk_key(text, sections, prompt_template, json_schema, model_name):
+    digest = hashlib.sha256()
+    for part in (text, ",".join(sections or ()), prompt_template, json.dumps(json_schema, sort_keys=True),
+                 model_name):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def cached_extract(extract_fn, cache, prompt_template, json_schema, model_name, refresh=False):
+    """Wrap ``extract_fn(text, sections=None) -> dict`` with ``cache``.
+
+    Works for both the chunked (``fn(text)``) and section-routed
+    (``fn(text, sections)``) drivers. With ``refresh``, every chunk is
+    extracted again and its cached result replaced.
+    """
+
+    def extract(text, sections=None):
+        key = chunk_key(text, sections, prompt_template, json_schema, model_name)
+        result = None if refresh else cache.get(key)
+        if result is not None:
+            tracing.count("chunk_cache_hits")
+            return result
+        result = extract_fn(text) if sections is None else extract_fn(text, sections)
+        cache.put(key, result)
+        return result
+
+    return extract
+
+
+_chunk_cache = None
+
+
+def get_chunk_cache():
+    global _chunk_cache
+    if _chunk_cache is None:
+        _chunk_cache = extraction_cache.ExtractionCache(
+            os.environ.get(CHUNK_CACHE_DIR_ENV_VAR, DEFAULT_CHUNK_CACHE_DIR)
+        )
+    return _chunk_cache
+
+
+# ---------- Page manifests ----------
+class PageManifests:
+    """Page fingerprints of the last processed version of each source file."""
+
+    def __init__(self, manifest_dir=None):
+        self.manifest_dir = Path(manifest_dir or os.environ.get(MANIFEST_DIR_ENV_VAR, DEFAULT_MANIFEST_DIR))
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, file_name):
+        return self.manifest_dir / f"{hashlib.sha256(file_name.encode('utf-8')).hexdigest()}.json"
+
+    def get(self, file_name):
+        try:
+            with open(self._path(file_name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def update(self, file_name, pages):
+        """Store the fingerprints of ``pages`` and return how they differ from
+        the previous version: page numbers (1-based) that are new or changed,
+        plus counts of unchanged and removed pages. For reporting only."""
+        fingerprints = [page_fingerprint(page) for page in pages]
+        previous = self.get(file_name)
+        old = set(previous["pages"]) if previous else set()
+        changed = [i + 1 for i, fp in enumerate(fingerprints) if fp not in old]
+        diff = {
+            "previousVersion": previous is not None,
+            "changedPages": changed,
+            "unchangedPages": len(fingerprints) - len(changed),
+            "removedPages": len(old - set(fingerprints)),
+        }
+        manifest = {
+            "sourceFileName": file_name,
+            "updatedAt": datetime.now(timezone.utc).isoformat(),
+            "pages": fingerprints,
+        }
+        path = self._path(file_name)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+
+        tracing.count("pages_changed", len(changed))
+        tracing.count("pages_unchanged", diff["unchangedPages"])
+        return diff
+
+
+_manifests = None
+
+
+def get_page_manifests():
+    global _manifests
+    if _manifests is None:
+        _manifests = PageManifests()
+    return _manifests
@@ -0,0 +1,545 @@
+"""Durable local job queue for report extraction.
+
+    python job_queue.py worker --processes 4      # run a worker pool
+    python job_queue.py worker --metrics-port 9100
+    python job_queue.py enqueue plan.pdf [--upload] [--incremental]
+    python job_queue.py status [JOB_ID]
+    python job_queue.py retry JOB_ID               # requeue a dead job
+
+Jobs live in a SQLite database (``JOB_QUEUE_DB``, default
+``.cache/jobs/jobs.sqlite3``) and their PDFs are spooled next to it, so
+both survive browser refreshes and process restarts. A worker claims a job
+under a lease that it renews while the job runs; if the worker dies, the
+lease expires and another worker picks the job up again (chunk results
+already produced are reused from the chunk cache). A failed job is retried
+with exponential backoff up to ``max_attempts`` times and then moved to
+``dead`` status, where it stays until retried by hand.
+
+Each job runs the firebase_database pipeline: extraction (cached, routed,
+incremental), schema validation with per-section repair, the local
+analytics store and, optionally, the Firestore upload.
+"""
+import argparse
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import pdf_extraction
+
+ROOT = Path(__file__).resolve().parent
+
+DB_ENV_VAR = "JOB_QUEUE_DB"
+DEFAULT_DB = ".cache/jobs/jobs.sqlite3"
+WORKERS_ENV_VAR = "JOB_WORKERS"
+DEFAULT_WORKERS = 2
+
+QUEUED, RUNNING, DONE, DEAD = "queued", "running", "done", "dead"
+
+DEFAULT_MAX_ATTEMPTS = 3
+LEASE_SECONDS = 120
+HEARTBEAT_SECONDS = 20
+POLL_SECONDS = 1.0
+RETRY_BASE_DELAY = 10.0
+RETRY_MAX_DELAY = 300.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    content_key TEXT NOT NULL,
+    source_file_name TEXT NOT NULL,
+    pdf_path TEXT NOT NULL,
+    options TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    not_before REAL NOT NULL DEFAULT 0,
+    lease_expires REAL,
+    worker TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, not_before, created_at);
+CREATE INDEX IF NOT EXISTS jobs_content ON jobs (content_key, status);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    seen_at REAL NOT NULL
+);
+"""
+
+_JOB_FIELDS = ("id", "sourceFileName", "status", "stage", "progress", "attempts", "maxAttempts", "error",
+               "createdAt", "updatedAt")
+
+
+def default_db_path():
+    return os.environ.get(DB_ENV_VAR, DEFAULT_DB)
+
+
+def _row_to_job(row):
+    job = dict(zip(_JOB_FIELDS, (row["id"], row["source_file_name"], row["status"], row["stage"], row["progress"],
+                                 row["attempts"], row["max_attempts"], row["error"], row["created_at"],
+                                 row["updated_at"])))
+    job["options"] = json.loads(row["options"])
+    job["result"] = json.loads(row["result"]) if row["result"] else None
+    return job
+
+
+class JobQueue:
+    """SQLite-backed queue; safe to use from several threads and processes."""
+
+    def __init__(self, db_path=None):
+        self.db_path = Path(db_path or default_db_path())
+        self.files_dir = self.db_path.parent / "files"
+        self.files_dir.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly below.
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        # IMMEDIATE takes the write lock up front, so two workers can never
+        # claim the same job.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # ---------- Producers ----------
+    def enqueue(self, pdf_file, file_name, upload=False, incremental=False, refresh=False,
+                prompt_template=None, json_schema=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Add a job and return its id.
+
+        ``prompt_template``/``json_schema`` default to the repository's
+        prompt.txt and schema.json. An identical request (same PDF bytes and
+        options) that is queued, running or done is returned instead of
+        adding a duplicate, unless ``refresh`` asks for a fresh extraction.
+        """
+        options = {"upload": upload, "incremental": incremental, "promptTemplate": prompt_template,
+                   "jsonSchema": json_schema}
+        content_key = hashlib.sha256(
+            (pdf_extraction.file_sha256(pdf_file) + json.dumps(options, sort_keys=True)).encode("utf-8")
+        ).hexdigest()
+        options["refresh"] = refresh
+        if not refresh:
+            existing = self._conn().execute(
+                "SELECT id FROM jobs WHERE content_key = ? AND source_file_name = ? AND status IN (?, ?, ?) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (content_key, file_name, QUEUED, RUNNING, DONE),
+            ).fetchone()
+            if existing:
+                return existing["id"]
+
+        job_id = uuid.uuid4().hex
+        pdf_path = self.files_dir / f"{job_id}.pdf"
+        if isinstance(pdf_file, (str, os.PathLike)):
+            shutil.copyfile(pdf_file, pdf_path)
+        elif isinstance(pdf_file, (bytes, bytearray)):
+            pdf_path.write_bytes(pdf_file)
+        else:
+            pdf_file.seek(0)
+            with open(pdf_path, "wb") as f:
+                shutil.copyfileobj(pdf_file, f, pdf_extraction.SPOOL_BLOCK_SIZE)
+            pdf_file.seek(0)
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, content_key, source_file_name, pdf_path, options, status, stage, "
+                "max_attempts, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, content_key, file_name, str(pdf_path), json.dumps(options), QUEUED, "queued",
+                 max_attempts, now, now),
+            )
+        return job_id
+
+    def get(self, job_id):
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def list(self, status=None, limit=50):
+        query, params = "SELECT * FROM jobs", ()
+        if status:
+            query, params = query + " WHERE status = ?", (status,)
+        rows = self._conn().execute(query + " ORDER BY created_at DESC LIMIT ?", params + (limit,)).fetchall()
+        return [_row_to_job(row) for row in rows]
+
+    def retry(self, job_id):
+        """Requeue a dead job with a fresh set of attempts."""
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, stage = 'queued', attempts = 0, not_before = 0, error = NULL, "
+                "updated_at = ? WHERE id = ? AND status = ?",
+                (QUEUED, time.time(), job_id, DEAD),
+            ).rowcount
+        return bool(updated)
+
+    def stats(self):
+        counts = dict.fromkeys((QUEUED, RUNNING, DONE, DEAD), 0)
+        for row in self._conn().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        counts["workers"] = self.live_workers()
+        return counts
+
+    def live_workers(self, max_age=HEARTBEAT_SECONDS * 3):
+        row = self._conn().execute(
+            "SELECT COUNT(*) AS n FROM workers WHERE seen_at > ?", (time.time() - max_age,)
+        ).fetchone()
+        return row["n"]
+
+    # ---------- Workers ----------
+    def claim(self, worker_id):
+        """Take the oldest runnable job: queued and due, or running with an
+        expired lease (its worker died). Returns the job or None.
+
+        A job whose workers keep dying (e.g. killed for memory) is
+        dead-lettered once it has used all its attempts."""
+        now = time.time()
+        with self._transaction() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE (status = ? AND not_before <= ?) OR (status = ? AND lease_expires < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (QUEUED, now, RUNNING, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row["status"] == QUEUED or row["attempts"] < row["max_attempts"]:
+                    break
+                conn.execute(
+                    "UPDATE jobs SET status = ?, stage = 'dead', error = ?, lease_expires = NULL, updated_at = ? "
+                    "WHERE id = ?",
+                    (DEAD, f"Worker {row['worker']} stopped while running the job", now, row["id"]),
+                )
+            conn.execute(
+                "UPDATE jobs SET status = ?, stage = 'starting', progress = 0, attempts = attempts + 1, "
+                "lease_expires = ?, worker = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, now + LEASE_SECONDS, worker_id, now, row["id"]),
+            )
+        job = _row_to_job(row)
+        job["pdfPath"] = row["pdf_path"]
+        job["attempts"] += 1
+        return job
+
+    def heartbeat(self, worker_id, job_id=None):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO workers (id, pid, seen_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET seen_at = excluded.seen_at",
+                (worker_id, os.getpid(), now),
+            )
+            if job_id:
+                conn.execute(
+                    "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = ?",
+                    (now + LEASE_SECONDS, job_id, worker_id, RUNNING),
+                )
+
+    # set_progress, complete and fail only touch a job the worker still
+    # holds: once its lease expired and another worker took the job over,
+    # the late worker's updates are dropped.
+    def set_progress(self, job_id, worker_id, stage, progress):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET stage = ?, progress = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                (stage, progress, time.time(), job_id, worker_id, RUNNING),
+            )
+
+    def complete(self, job_id, worker_id, result):
+        """Store the result; returns False if the job is no longer this worker's."""
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, stage = 'done', progress = 1, result = ?, error = NULL, "
+                "lease_expires = NULL, updated_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                (DONE, json.dumps(result, default=str), time.time(), job_id, worker_id, RUNNING),
+            ).rowcount
+            if not updated:
+                return False
+            pdf_path = conn.execute("SELECT pdf_path FROM jobs WHERE id = ?", (job_id,)).fetchone()["pdf_path"]
+        try:
+            os.unlink(pdf_path)
+        except OSError:
+            pass
+        return True
+
+    def fail(self, job_id, worker_id, error):
+        """Schedule a retry with jittered exponential backoff, or dead-letter
+        the job once it has used all its attempts. Returns the new status, or
+        None if the job is no longer this worker's."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND worker = ? AND status = ?",
+                (job_id, worker_id, RUNNING),
+            ).fetchone()
+            if row is None:
+                return None
+            if row["attempts"] >= row["max_attempts"]:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, stage = 'dead', error = ?, lease_expires = NULL, updated_at = ? "
+                    "WHERE id = ?",
+                    (DEAD, error, now, job_id),
+                )
+                return DEAD
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (row["attempts"] - 1)))
+            conn.execute(
+                "UPDATE jobs SET status = ?, stage = 'retrying', error = ?, not_before = ?, lease_expires = NULL, "
+                "updated_at = ? WHERE id = ?",
+                (QUEUED, error, now + delay, now, job_id),
+            )
+            return QUEUED
+
+
+# ---------- Running a job ----------
+# Compiled validators by schema, so a worker checks and compiles each schema
+# once rather than on every job.
+_validators = {}
+
+
+def _get_validator(json_schema):
+    import schema_validation
+
+    key = json.dumps(json_schema, sort_keys=True)
+    if key not in _validators:
+        _validators[key] = schema_validation.SchemaValidator(json_schema)
+    return _validators[key]
+
+
+def run_job(job, progress):
+    """The extraction-and-upload pipeline for one job; returns its result."""
+    import analytics_store
+    import extraction_cache
+    import firebase_database
+    import schema_validation
+    import tracing
+
+    options = job["options"]
+    name = job["sourceFileName"]
+    json_schema = options["jsonSchema"] or firebase_database.get_json_schema(str(ROOT / "schema.json"))
+    prompt_template = options["promptTemplate"] or firebase_database.get_prompt_template(str(ROOT / "prompt.txt"))
+
+    with tracing.start_trace("job_queue", sourceFileName=name, jobId=job["id"], attempt=job["attempts"]) as trace:
+        progress("extracting", 0.1)
+        # A bounded view of the raw text for the apps; the full text stays here.
+        preview = pdf_extraction.preview_text(job["pdfPath"])
+        cache_key = firebase_database.extraction_cache_key(job["pdfPath"], json_schema, prompt_template)
+        data = firebase_database.extract_structured_data(
+            job["pdfPath"], json_schema, prompt_template, file_name=name, refresh=options["refresh"],
+            cache_key=cache_key,
+        )
+
+        progress("validating", 0.7)
+        validator = _get_validator(json_schema)
+        with tracing.stage("validation"):
+            errors = validator.errors_by_section(data)
+        if errors:
+            remaining = schema_validation.repair_sections(
+                validator, data, errors,
+                lambda prompt, section_schema: firebase_database.generate_structured_data(
+                    prompt, section_schema, "{pdf_text}"
+                ),
+            )
+            if len(remaining) < len(errors):
+                # Cache the repaired report, so later hits skip the repair calls.
+                extraction_cache.get_default_cache().put(cache_key, data)
+            errors = remaining
+        analytics_store.record_report(name, data)
+
+        upload = None
+        if options["upload"]:
+            progress("uploading", 0.8)
+            sync = (firebase_database.sync_data_incremental if options["incremental"]
+                    else firebase_database.upload_data_normalized)
+            upload = sync(name, data.get("summary", {}), data)
+
+    return {"data": data, "validationErrors": errors, "upload": upload, "textPreview": preview,
+            "trace": trace.to_dict()}
+
+
+def _heartbeat_loop(queue, worker_id, current, stop):
+    while not stop.wait(HEARTBEAT_SECONDS):
+        try:
+            queue.heartbeat(worker_id, current.get("job"))
+        except sqlite3.Error:
+            pass
+
+
+def worker_main(db_path=None, worker_id=None, secrets_source=None, once=False):
+    """Claim and run jobs until interrupted (or until the queue is empty, with ``once``)."""
+    import firebase_database
+
+    queue = JobQueue(db_path)
+    worker_id = worker_id or f"{os.uname().nodename}-{os.getpid()}"
+    if secrets_source is not None:
+        firebase_database.configure(secrets_source)
+
+    current, stop = {}, threading.Event()
+    threading.Thread(target=_heartbeat_loop, args=(queue, worker_id, current, stop), daemon=True).start()
+    queue.heartbeat(worker_id)
+    try:
+        while True:
+            job = queue.claim(worker_id)
+            if job is None:
+                if once:
+                    return
+                time.sleep(POLL_SECONDS)
+                continue
+            current["job"] = job["id"]
+            try:
+                result = run_job(job, lambda stage, value: queue.set_progress(job["id"], worker_id, stage, value))
+            except Exception as e:
+                queue.fail(job["id"], worker_id, f"{type(e).__name__}: {e}")
+            else:
+                queue.complete(job["id"], worker_id, result)
+            finally:
+                current.pop("job", None)
+    finally:
+        stop.set()
+
+
+def share_metrics(db_path=None):
+    """Pool metrics through METRICS_DIR (default ``metrics/`` next to the queue database)."""
+    import tracing
+
+    os.environ.setdefault(tracing.METRICS_DIR_ENV_VAR, str(Path(db_path or default_db_path()).parent / "metrics"))
+
+
+_started_workers = []
+
+
+def _stop_workers():
+    for worker in _started_workers:
+        if worker.is_alive():
+            worker.terminate()
+    for worker in _started_workers:
+        worker.join(timeout=5)
+
+
+def spawn_worker(target=worker_main, args=()):
+    """Start one worker process that is stopped when this process exits."""
+    if not _started_workers:
+        # Registered after multiprocessing's own exit handler, so it runs
+        # first: workers are terminated rather than waited for.
+        atexit.register(_stop_workers)
+    # "spawn": never fork a process that is already running server threads.
+    # Not daemonic: workers start process pools for PDF parsing and OCR,
+    # which daemonic processes may not do.
+    worker = multiprocessing.get_context("spawn").Process(target=target, args=args)
+    worker.start()
+    _started_workers.append(worker)
+    return worker
+
+
+def model_call_slots(db_path=None):
+    """The cap on model calls in flight across this queue's workers."""
+    import call_slots
+
+    return call_slots.get_call_slots(Path(db_path or default_db_path()).parent / "llm_slots")
+
+
+def start_workers(processes=None, db_path=None, secrets_source=None):
+    """Start ``processes`` worker processes (default JOB_WORKERS) and return them.
+
+    Workers are terminated when the starting process exits; jobs they were
+    running are picked up again once their leases expire. They share a
+    METRICS_DIR (see share_metrics), so the starting process's /metrics
+    reports the whole pool, and one model call cap (see model_call_slots).
+    """
+    import call_slots
+
+    share_metrics(db_path)
+    os.environ.setdefault(call_slots.SLOT_DIR_ENV_VAR, str(model_call_slots(db_path).slot_dir))
+    processes = processes if processes is not None else int(os.environ.get(WORKERS_ENV_VAR, DEFAULT_WORKERS))
+    return [spawn_worker(worker_main, (db_path, None, secrets_source)) for _ in range(processes)]
+
+
+# ---------- CLI ----------
+def _print_job(job):
+    print(f"{job['id']}  {job['status']:8} {job['stage'] or '':11} {job['progress']:4.0%}  "
+          f"attempt {job['attempts']}/{job['maxAttempts']}  {job['sourceFileName']}"
+          + (f"\n    {job['error']}" if job["error"] else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help=f"queue database (default: {DB_ENV_VAR} or {DEFAULT_DB})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    worker = commands.add_parser("worker", help="run a pool of worker processes")
+    worker.add_argument("-p", "--processes", type=int, default=None, help=f"default: {WORKERS_ENV_VAR} or 2")
+    worker.add_argument("--metrics-port", type=int, default=None,
+                        help="serve the pool's Prometheus metrics on /metrics")
+    worker.add_argument("--secrets", help='secrets source: "env", "file:<path>" or "streamlit" (see settings.py)')
+
+    enqueue = commands.add_parser("enqueue", help="queue PDFs for extraction")
+    enqueue.add_argument("pdfs", nargs="+")
+    enqueue.add_argument("--upload", action="store_true")
+    enqueue.add_argument("--incremental", action="store_true")
+    enqueue.add_argument("--refresh", action="store_true", help="ignore cached extractions")
+
+    status = commands.add_parser("status", help="show queue counts, or one job")
+    status.add_argument("job_id", nargs="?")
+
+    retry = commands.add_parser("retry", help="requeue a dead job")
+    retry.add_argument("job_id")
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        import tracing
+
+        processes = start_workers(args.processes, args.db, args.secrets)
+        tracing.start_metrics_server(args.metrics_port)
+        for process in processes:
+            process.join()
+        return 0
+
+    queue = JobQueue(args.db)
+    if args.command == "enqueue":
+        for path in args.pdfs:
+            print(queue.enqueue(path, os.path.basename(path), args.upload, args.incremental, args.refresh), path)
+    elif args.command == "status":
+        if args.job_id:
+            job = queue.get(args.job_id)
+            if job is None:
+                print(f"No job {args.job_id}", file=sys.stderr)
+                return 1
+            _print_job(job)
+        else:
+            print(json.dumps(queue.stats()))
+            for job in queue.list(limit=20):
+                _print_job(job)
+    elif args.command == "retry":
+        if not queue.retry(args.job_id):
+            print(f"Job {args.job_id} is not dead", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
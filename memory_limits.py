@@ -0,0 +1,51 @@
+"""Per-job memory ceiling.
+
+``MemoryGuard`` records the process's resident set size when a job starts;
+``check()`` raises ``MemoryLimitExceeded`` once the job has grown it by
+more than the limit (``JOB_MEMORY_LIMIT_MB``, default 1024; 0 disables).
+RSS is read from /proc/self/statm, so the guard is a no-op where that does
+not exist. Concurrent jobs in one process share the RSS, so each guard sees
+the others' growth too; the ceiling is conservative, never lax.
+"""
+import os
+
+LIMIT_ENV_VAR = "JOB_MEMORY_LIMIT_MB"
+DEFAULT_LIMIT_MB = 1024
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class MemoryLimitExceeded(RuntimeError):
+    pass
+
+
+def rss_bytes():
+    """Current resident set size, or None if it cannot be read."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def default_limit_mb():
+    return int(os.environ.get(LIMIT_ENV_VAR, DEFAULT_LIMIT_MB))
+
+
+class MemoryGuard:
+    def __init__(self, limit_mb=None, job=None):
+        self.limit_mb = default_limit_mb() if limit_mb is None else limit_mb
+        self.job = job
+        self.baseline = rss_bytes()
+        self.peak = 0
+
+    def check(self):
+        if not self.limit_mb or self.baseline is None:
+            return
+        grown = rss_bytes() - self.baseline
+        self.peak = max(self.peak, grown)
+        if grown > self.limit_mb * 1024 * 1024:
+            raise MemoryLimitExceeded(
+                f"{self.job or 'Job'} grew memory by {grown / 2**20:.0f} MiB, over the "
+                f"{self.limit_mb} MiB limit ({LIMIT_ENV_VAR})"
+            )
@@ -0,0 +1,151 @@
+"""Interchangeable PDF text backends.
+
+Every backend opens a document from bytes or a file path (read on demand,
+without holding the file in memory) and returns page text by 0-based page
+number. ``open_document(source, name)`` picks one by name; the default
+comes from ``PDF_BACKEND`` (``auto`` unless set):
+
+- ``pdfplumber``: layout-aware, slowest
+- ``pymupdf``: fastest, content-stream order
+- ``pypdf2``: pure Python
+- ``auto``: PyMuPDF for every page, pdfplumber only for pages that look
+  like tables (many ruling lines), where its row grouping matters
+"""
+import io
+import os
+
+BACKEND_ENV_VAR = "PDF_BACKEND"
+DEFAULT_BACKEND = "auto"
+
+# Ruling lines/rects on a page from which we assume a table and let
+# pdfplumber (which keeps cells of a row on one line) handle it.
+TABLE_DRAWINGS_THRESHOLD = 12
+
+
+def _is_bytes(source):
+    return isinstance(source, (bytes, bytearray))
+
+
+class PdfBackend:
+    name = None
+    # Documents shorter than this are extracted serially.
+    min_pages_for_pool = 16
+    page_count = 0
+
+    def page_text(self, page_number):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PdfplumberBackend(PdfBackend):
+    name = "pdfplumber"
+    # Per-page cost is high, so a process pool pays off early.
+    min_pages_for_pool = 16
+
+    def __init__(self, source):
+        import pdfplumber
+
+        self._pdf = pdfplumber.open(io.BytesIO(source) if _is_bytes(source) else source)
+        self.page_count = len(self._pdf.pages)
+
+    def page_text(self, page_number):
+        page = self._pdf.pages[page_number]
+        text = page.extract_text() or ""
+        # Drop the cached layout objects as soon as the text is out.
+        page.close()
+        return text
+
+    def close(self):
+        self._pdf.close()
+
+
+class PyMuPDFBackend(PdfBackend):
+    name = "pymupdf"
+    min_pages_for_pool = 400
+
+    def __init__(self, source):
+        import pymupdf
+
+        self._doc = pymupdf.open(stream=source, filetype="pdf") if _is_bytes(source) else pymupdf.open(source)
+        self.page_count = self._doc.page_count
+
+    def page_text(self, page_number):
+        return self._doc[page_number].get_text("text")
+
+    def looks_like_table(self, page_number):
+        page = self._doc[page_number]
+        ruling = sum(1 for d in page.get_drawings() if any(item[0] in ("l", "re") for item in d["items"]))
+        return ruling >= TABLE_DRAWINGS_THRESHOLD
+
+    def close(self):
+        self._doc.close()
+
+
+class PyPDF2Backend(PdfBackend):
+    name = "pypdf2"
+    min_pages_for_pool = 64
+
+    def __init__(self, source):
+        from PyPDF2 import PdfReader
+
+        self._reader = PdfReader(io.BytesIO(source) if _is_bytes(source) else source)
+        self.page_count = len(self._reader.pages)
+
+    def page_text(self, page_number):
+        return self._reader.pages[page_number].extract_text() or ""
+
+
+class AutoBackend(PdfBackend):
+    name = "auto"
+    min_pages_for_pool = 64
+
+    def __init__(self, source):
+        self._source = source
+        self._fast = PyMuPDFBackend(source)
+        self._layout = None
+        self.page_count = self._fast.page_count
+        self.layout_pages = 0
+
+    def page_text(self, page_number):
+        if not self._fast.looks_like_table(page_number):
+            return self._fast.page_text(page_number)
+        if self._layout is None:
+            self._layout = PdfplumberBackend(self._source)
+        self.layout_pages += 1
+        return self._layout.page_text(page_number)
+
+    def close(self):
+        self._fast.close()
+        if self._layout is not None:
+            self._layout.close()
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (PdfplumberBackend, PyMuPDFBackend, PyPDF2Backend, AutoBackend)
+}
+
+
+def default_backend():
+    return os.environ.get(BACKEND_ENV_VAR, DEFAULT_BACKEND)
+
+
+def get_backend(name=None):
+    name = name or default_backend()
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown PDF backend {name!r}; expected one of {sorted(BACKENDS)}")
+
+
+def open_document(source, name=None):
+    """Open ``source`` (PDF bytes or a path) with the named backend."""
+    return get_backend(name)(source)
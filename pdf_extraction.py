@@ -0,0 +1,272 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import memory_limits
+import pdf_backends
+import pdf_ocr
+import tracing
+
+# Pages handed to a worker per task: small enough to balance load across
+# cores, large enough that task overhead stays negligible.
+PAGES_PER_TASK = 8
+
+# Set PDF_EXTRACT_WORKERS=1 to force serial extraction.
+WORKERS_ENV_VAR = "PDF_EXTRACT_WORKERS"
+
+# Set OCR_ENABLED=0 to skip the OCR pass for scanned pages.
+OCR_ENV_VAR = "OCR_ENABLED"
+
+# PDF_STREAMING=1 always streams pages from a spooled temp file, 0 never
+# does; by default inputs of at least STREAMING_MIN_BYTES or
+# STREAMING_MIN_PAGES pages are streamed. Page count is what drives memory
+# use: a text-only 500-page plan is only a few MB.
+STREAMING_ENV_VAR = "PDF_STREAMING"
+STREAMING_MIN_BYTES = 20 * 1024 * 1024
+STREAMING_MIN_PAGES = 150
+
+SPOOL_BLOCK_SIZE = 1024 * 1024
+
+# Characters of raw text kept for display (see preview_text).
+PREVIEW_CHARS = 20000
+
+# Per-process state for pool workers (set by _init_worker).
+_worker_doc = None
+
+
+# ---------- Helper: Normalise any PDF input to bytes ----------
+def read_pdf_bytes(pdf_file):
+    """Accept a path, raw bytes, or a file-like object (e.g. Streamlit UploadedFile)."""
+    if isinstance(pdf_file, (bytes, bytearray)):
+        return bytes(pdf_file)
+    if isinstance(pdf_file, (str, os.PathLike)):
+        with open(pdf_file, "rb") as f:
+            return f.read()
+    if hasattr(pdf_file, "getvalue"):
+        return pdf_file.getvalue()
+    if hasattr(pdf_file, "seek"):
+        pdf_file.seek(0)
+    return pdf_file.read()
+
+
+def source_size(pdf_file):
+    """Size in bytes of any accepted PDF input, without reading it."""
+    if isinstance(pdf_file, (bytes, bytearray)):
+        return len(pdf_file)
+    if isinstance(pdf_file, (str, os.PathLike)):
+        return os.path.getsize(pdf_file)
+    if getattr(pdf_file, "size", None) is not None:
+        return pdf_file.size
+    position = pdf_file.tell()
+    size = pdf_file.seek(0, os.SEEK_END)
+    pdf_file.seek(position)
+    return size
+
+
+def file_sha256(pdf_file):
+    """SHA-256 of any accepted PDF input, read in blocks rather than copied."""
+    if isinstance(pdf_file, (bytes, bytearray)):
+        return hashlib.sha256(pdf_file).hexdigest()
+    if isinstance(pdf_file, (str, os.PathLike)):
+        with open(pdf_file, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    pdf_file.seek(0)
+    digest = hashlib.file_digest(pdf_file, "sha256").hexdigest()
+    pdf_file.seek(0)
+    return digest
+
+
+@contextmanager
+def spooled_pdf(pdf_file):
+    """A filesystem path for ``pdf_file``; uploads and bytes are copied to a
+    temporary file in blocks, which is removed afterwards."""
+    if isinstance(pdf_file, (str, os.PathLike)):
+        yield pdf_file
+        return
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as spool:
+        if isinstance(pdf_file, (bytes, bytearray)):
+            spool.write(pdf_file)
+        else:
+            pdf_file.seek(0)
+            shutil.copyfileobj(pdf_file, spool, SPOOL_BLOCK_SIZE)
+            pdf_file.seek(0)
+    try:
+        yield spool.name
+    finally:
+        os.unlink(spool.name)
+
+
+def streaming_enabled(pdf_file, page_count=None):
+    configured = os.environ.get(STREAMING_ENV_VAR)
+    if configured in ("0", "1"):
+        return configured == "1"
+    if source_size(pdf_file) >= STREAMING_MIN_BYTES:
+        return True
+    return page_count is not None and page_count >= STREAMING_MIN_PAGES
+
+
+def default_worker_count():
+    configured = os.environ.get(WORKERS_ENV_VAR)
+    if configured:
+        return max(1, int(configured))
+    return os.cpu_count() or 1
+
+
+# ---------- Serial path ----------
+def _extract_serial(pdf_bytes, backend, guard):
+    page_texts = []
+    with pdf_backends.open_document(pdf_bytes, backend) as doc:
+        for i in range(doc.page_count):
+            page_texts.append(doc.page_text(i))
+            guard.check()
+    return page_texts
+
+
+# ---------- Pool path ----------
+def _init_worker(pdf_bytes, backend):
+    # Each worker parses the document once and reuses it for all its tasks.
+    global _worker_doc
+    _worker_doc = pdf_backends.open_document(pdf_bytes, backend)
+
+
+def _extract_range(start, stop):
+    return [_worker_doc.page_text(i) for i in range(start, stop)]
+
+
+def _extract_parallel(pdf_bytes, page_count, workers, backend, guard):
+    ranges = [
+        (start, min(start + PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PAGES_PER_TASK)
+    ]
+    starts, stops = zip(*ranges)
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(ranges)),
+        initializer=_init_worker,
+        initargs=(pdf_bytes, backend),
+    ) as pool:
+        # map() yields in submission order, so pages come back in order.
+        page_texts = []
+        for chunk in pool.map(_extract_range, starts, stops):
+            page_texts.extend(chunk)
+            guard.check()
+        return page_texts
+
+
+def _extract_text_layer(pdf_bytes, page_count, min_pages_for_pool, workers, backend, guard):
+    if workers <= 1 or page_count < min_pages_for_pool:
+        return _extract_serial(pdf_bytes, backend, guard)
+
+    try:
+        return _extract_parallel(pdf_bytes, page_count, workers, backend, guard)
+    except (BrokenProcessPool, OSError):
+        # Sandboxed hosts may forbid subprocesses; fall back to one core.
+        return _extract_serial(pdf_bytes, backend, guard)
+
+
+def ocr_enabled():
+    return os.environ.get(OCR_ENV_VAR, "1") != "0"
+
+
+# ---------- Streaming path ----------
+def iter_pages(path, ocr=None, ocr_dpi=None, backend=None, guard=None):
+    """Yield page texts one at a time from a PDF file on disk.
+
+    Only the current page is held in memory: the backend reads it from the
+    file, drops its layout objects once the text is out, and scanned pages
+    are OCR'd one by one. ``guard`` (a memory_limits.MemoryGuard) is checked
+    after every page.
+    """
+    if ocr is None:
+        ocr = ocr_enabled()
+    with pdf_backends.open_document(path, backend or pdf_backends.default_backend()) as doc:
+        for page_number in range(doc.page_count):
+            text = doc.page_text(page_number)
+            if ocr and pdf_ocr.needs_ocr(text):
+                text = pdf_ocr.fill_scanned_pages(path, [text], dpi=ocr_dpi, page_numbers=[page_number])[0]
+            if guard is not None:
+                guard.check()
+            yield text
+
+
+def _extract_streaming(pdf_file, ocr, ocr_dpi, backend):
+    guard = memory_limits.MemoryGuard(job="PDF extraction")
+    with spooled_pdf(pdf_file) as path, tracing.stage("pdf_parse"):
+        page_texts = list(iter_pages(path, ocr=ocr, ocr_dpi=ocr_dpi, backend=backend, guard=guard))
+    tracing.count("streamed_pages", len(page_texts))
+    return page_texts
+
+
+def _extract_in_memory(pdf_file, max_workers, ocr, ocr_dpi, backend, may_stream):
+    backend = backend or pdf_backends.default_backend()
+    # Paths are opened in place to count pages; the bytes are only read once
+    # the document is known not to be streamed.
+    is_path = isinstance(pdf_file, (str, os.PathLike))
+    pdf_bytes = None if is_path else read_pdf_bytes(pdf_file)
+    with pdf_backends.open_document(pdf_file if is_path else pdf_bytes, backend) as doc:
+        page_count = doc.page_count
+        min_pages_for_pool = doc.min_pages_for_pool
+    if may_stream and streaming_enabled(pdf_file, page_count):
+        pdf_bytes = None
+        return _extract_streaming(pdf_file, ocr, ocr_dpi, backend)
+    if pdf_bytes is None:
+        pdf_bytes = read_pdf_bytes(pdf_file)
+
+    guard = memory_limits.MemoryGuard(job="PDF extraction")
+    workers = max_workers if max_workers is not None else default_worker_count()
+    with tracing.stage("pdf_parse"):
+        page_texts = _extract_text_layer(pdf_bytes, page_count, min_pages_for_pool, workers, backend, guard)
+    if ocr is None:
+        ocr = ocr_enabled()
+    if ocr:
+        with tracing.stage("ocr"):
+            page_texts = pdf_ocr.fill_scanned_pages(pdf_bytes, page_texts, dpi=ocr_dpi, max_workers=workers)
+        guard.check()
+    return page_texts
+
+
+def extract_pages(pdf_file, max_workers=None, ocr=None, ocr_dpi=None, backend=None, streaming=None):
+    """Return the text of every page in order.
+
+    ``backend`` names a pdf_backends backend (default: PDF_BACKEND, "auto").
+    Pages without a usable text layer are OCR'd (only those pages) unless
+    ``ocr`` is False; pages that still have no text give "".
+
+    ``streaming`` (default: see streaming_enabled) reads pages one at a time
+    from a temp-file spool instead of loading the whole document into every
+    worker. Both paths stop at the JOB_MEMORY_LIMIT_MB ceiling.
+    """
+    if streaming is None and streaming_enabled(pdf_file):
+        streaming = True
+    if streaming:
+        page_texts = _extract_streaming(pdf_file, ocr, ocr_dpi, backend)
+    else:
+        page_texts = _extract_in_memory(pdf_file, max_workers, ocr, ocr_dpi, backend, streaming is None)
+    tracing.count("pages", len(page_texts))
+    tracing.count("text_chars", sum(len(text) for text in page_texts))
+    return page_texts
+
+
+def preview_text(pdf_file, max_chars=PREVIEW_CHARS):
+    """The first ``max_chars`` of the document's text layer, read page by page
+    (no OCR); returns ``{"text", "truncated"}``."""
+    parts, size = [], 0
+    with spooled_pdf(pdf_file) as path:
+        for text in iter_pages(path, ocr=False):
+            parts.append(f"{text}\n" if text else "")
+            size += len(parts[-1])
+            if size > max_chars:
+                break
+    text = "".join(parts)
+    return {"text": text[:max_chars], "truncated": len(text) > max_chars}
+
+
+def join_pages(page_texts):
+    return "".join(f"{text}\n" for text in page_texts if text)
+
+
+def extract_text_from_pdf(pdf_file, max_workers=None, backend=None):
+    return join_pages(extract_pages(pdf_file, max_workers=max_workers, backend=backend))
@@ -0,0 +1,106 @@
+import io
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import tracing
+
+# Pages whose text layer has fewer characters than this are treated as scanned.
+MIN_TEXT_CHARS = 20
+
+DPI_ENV_VAR = "OCR_DPI"
+DEFAULT_DPI = 200
+
+OCR_LANG_ENV_VAR = "OCR_LANG"
+DEFAULT_LANG = "eng"
+
+# Per-process state for pool workers (set by _init_worker).
+_worker_doc = None
+
+
+def needs_ocr(page_text, min_chars=MIN_TEXT_CHARS):
+    return len((page_text or "").strip()) < min_chars
+
+
+def default_dpi():
+    return int(os.environ.get(DPI_ENV_VAR, DEFAULT_DPI))
+
+
+def _ocr_page(doc, page_number, dpi, lang):
+    import pytesseract
+    from PIL import Image
+
+    # Rasterise just this page with PyMuPDF (no poppler needed).
+    pixmap = doc[page_number].get_pixmap(dpi=dpi, colorspace="gray")
+    image = Image.open(io.BytesIO(pixmap.tobytes("png")))
+    return pytesseract.image_to_string(image, lang=lang)
+
+
+def _open(source):
+    import pymupdf
+
+    if isinstance(source, (bytes, bytearray)):
+        return pymupdf.open(stream=source, filetype="pdf")
+    return pymupdf.open(source)
+
+
+def _init_worker(source):
+    global _worker_doc
+    _worker_doc = _open(source)
+
+
+def _ocr_worker(page_number, dpi, lang):
+    return _ocr_page(_worker_doc, page_number, dpi, lang)
+
+
+def _ocr_serial(source, page_numbers, dpi, lang):
+    with _open(source) as doc:
+        return [_ocr_page(doc, n, dpi, lang) for n in page_numbers]
+
+
+def ocr_pages(source, page_numbers, dpi=None, max_workers=None, lang=None):
+    """OCR only ``page_numbers`` (0-based) of ``source`` (PDF bytes or a path)
+    and return their texts in the same order."""
+    page_numbers = list(page_numbers)
+    if not page_numbers:
+        return []
+    dpi = dpi or default_dpi()
+    lang = lang or os.environ.get(OCR_LANG_ENV_VAR, DEFAULT_LANG)
+    workers = min(max_workers or os.cpu_count() or 1, len(page_numbers))
+
+    if workers <= 1:
+        return _ocr_serial(source, page_numbers, dpi, lang)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(source,)) as pool:
+            n = len(page_numbers)
+            return list(pool.map(_ocr_worker, page_numbers, [dpi] * n, [lang] * n))
+    except (BrokenProcessPool, OSError):
+        return _ocr_serial(source, page_numbers, dpi, lang)
+
+
+def fill_scanned_pages(source, page_texts, dpi=None, max_workers=None, page_numbers=None):
+    """Replace the text of pages without a usable text layer with OCR output.
+
+    Pages that already have text are left alone. ``page_numbers`` gives the
+    document page of each entry of ``page_texts`` when they are not simply
+    pages 0..n-1 (e.g. one page at a time while streaming). If the OCR dependencies
+    (pytesseract + the tesseract binary, pymupdf) are missing, a warning is
+    issued and the original texts are returned.
+    """
+    scanned = [i for i, text in enumerate(page_texts) if needs_ocr(text)]
+    if not scanned:
+        return page_texts
+    tracing.count("ocr_pages", len(scanned))
+    document_pages = [page_numbers[i] for i in scanned] if page_numbers is not None else scanned
+    try:
+        ocr_texts = ocr_pages(source, document_pages, dpi=dpi, max_workers=max_workers)
+    except Exception as e:
+        warnings.warn(f"OCR skipped for {len(scanned)} scanned page(s): {e}")
+        return page_texts
+
+    page_texts = list(page_texts)
+    for page_number, text in zip(scanned, ocr_texts):
+        if text.strip():
+            page_texts[page_number] = text
+    return page_texts
@@ -0,0 +1,108 @@
+"""Shrink extracted page text before it goes into a prompt.
+
+``compact_pages(pages)`` returns new page texts with
+
+- running headers/footers removed: lines near the top or bottom of a page
+  that recur (ignoring digits, so "Page 3 of 40" matches "Page 4 of 40") on
+  a good share of the pages, and bare page numbers;
+- table-of-contents, index and list-of-figures pages emptied (page
+  positions are kept so page numbers still line up);
+- runs of spaces/tabs collapsed and blank lines squeezed.
+
+The returned report gives the estimated tokens before and after; the same
+figures are recorded on the current trace.
+"""
+import re
+from collections import Counter
+
+import tracing
+from chunked_extraction import estimate_tokens
+
+# Lines this close to the top/bottom of a page are header/footer candidates.
+EDGE_LINES = 2
+# A candidate recurring on at least this share of pages (and on at least
+# MIN_REPEAT_PAGES pages) is boilerplate.
+MIN_REPEAT_FRACTION = 0.4
+MIN_REPEAT_PAGES = 3
+
+_SPACES_RE = re.compile(r"[ \t\u00a0]+")
+_DIGITS_RE = re.compile(r"\d+")
+_PAGE_NUMBER_RE = re.compile(r"^(?:page\s*)?[-–]?\s*(?:\d{1,4}|[ivxlc]{1,6})\s*[-–]?(?:\s*of\s*\d{1,4})?$", re.I)
+_TOC_HEADING_RE = re.compile(r"^(?:table of contents|contents|index|list of (?:tables|figures|maps|appendices))\b", re.I)
+# "3.2 Monitoring ........ 41"
+_LEADER_ENTRY_RE = re.compile(r"(?:\.{3,}|…+)\s*\d{1,4}$")
+# "Figure 4: Land use 17" (only trusted under a contents/index heading)
+_NUMBERED_ENTRY_RE = re.compile(r"\D\s\d{1,4}$")
+
+
+def _lines(text):
+    return [_SPACES_RE.sub(" ", raw).strip() for raw in (text or "").splitlines()]
+
+
+def _signature(line):
+    return _DIGITS_RE.sub("#", line.lower())
+
+
+def _edge_lines(lines):
+    content = [line for line in lines if line]
+    return content[:EDGE_LINES] + content[-EDGE_LINES:]
+
+
+def repeated_lines(pages):
+    """Signatures of header/footer lines recurring across ``pages`` (lists of lines)."""
+    counts = Counter()
+    for lines in pages:
+        counts.update({_signature(line) for line in _edge_lines(lines)})
+    threshold = max(MIN_REPEAT_PAGES, MIN_REPEAT_FRACTION * len(pages))
+    return {signature for signature, n in counts.items() if n >= threshold}
+
+
+def is_toc_page(lines):
+    content = [line for line in lines if line]
+    if len(content) < 5:
+        return False
+    # Without a heading only dot leaders count: tables of figures also end
+    # most lines in a number.
+    if any(_TOC_HEADING_RE.match(line) for line in content[:3]):
+        entries = sum(1 for line in content if _LEADER_ENTRY_RE.search(line) or _NUMBERED_ENTRY_RE.search(line))
+        return entries / len(content) >= 0.4
+    entries = sum(1 for line in content if _LEADER_ENTRY_RE.search(line))
+    return entries / len(content) >= 0.6
+
+
+def _compact_page(lines, boilerplate):
+    edges = set(_edge_lines(lines))
+    kept = []
+    for line in lines:
+        if line in edges and (_signature(line) in boilerplate or _PAGE_NUMBER_RE.match(line)):
+            continue
+        if not line and (not kept or not kept[-1]):
+            continue
+        kept.append(line)
+    return "\n".join(kept).strip()
+
+
+def compact_pages(pages):
+    """Return ``(compacted_pages, report)``; see the module docstring."""
+    with tracing.stage("compact"):
+        split = [_lines(text) for text in pages]
+        boilerplate = repeated_lines(split) if len(split) >= MIN_REPEAT_PAGES else set()
+        toc_pages = [i for i, lines in enumerate(split) if is_toc_page(lines)]
+        compacted = [
+            "" if i in toc_pages else _compact_page(lines, boilerplate)
+            for i, lines in enumerate(split)
+        ]
+
+    tokens_before = sum(estimate_tokens(text) for text in pages if text)
+    tokens_after = sum(estimate_tokens(text) for text in compacted if text)
+    report = {
+        "tokensBefore": tokens_before,
+        "tokensAfter": tokens_after,
+        "savedPct": round(100 * (1 - tokens_after / tokens_before), 1) if tokens_before else 0.0,
+        "boilerplateLines": len(boilerplate),
+        "tocPages": [i + 1 for i in toc_pages],
+    }
+    tracing.count("input_tokens_before_compaction", tokens_before)
+    tracing.count("input_tokens_after_compaction", tokens_after)
+    tracing.count("toc_pages_dropped", len(toc_pages))
+    return compacted, report
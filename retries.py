@@ -0,0 +1,34 @@
+import random
+import time
+
+import tracing
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 30.0
+
+# HTTP statuses worth retrying: rate limiting and transient server errors.
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+# ---------- Retry with jittered exponential backoff ----------
+def is_retryable(exc):
+    # google.api_core exceptions carry the HTTP status as an int-like `code`.
+    code = getattr(exc, "code", None)
+    if isinstance(code, int) and code in RETRYABLE_STATUS_CODES:
+        return True
+    return isinstance(exc, (TimeoutError, ConnectionError))
+
+
+def call_with_retries(fn, *args, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                      base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                      retryable=is_retryable, **kwargs):
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == max_attempts or not retryable(e):
+                raise
+            tracing.count("retries")
+            # "Full jitter": spread retries so parallel callers don't stampede.
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1))))
@@ -0,0 +1,133 @@
+"""Per-report aggregates for the dashboard.
+
+Every upload writes one small ``rollups/{sourceFileName}`` document holding
+that report's contribution (goal status counts, BMP totals by category,
+monitoring target vs achieved by metric). Dashboard aggregates are the sum
+of these documents, so serving them never scans the section collections,
+and ``RollupIndex`` only re-reads rollups written since its last refresh.
+"""
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+
+ROLLUP_COLLECTION = "rollups"
+
+# Rollups committed up to this long before the newest one already read are
+# read again, so a batch that commits late is never skipped.
+REFRESH_OVERLAP = timedelta(minutes=2)
+
+NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def to_number(value):
+    """Best-effort numeric value of model output such as "1,200 acres" or "35%"."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER_RE.search(str(value).replace(",", ""))
+    return float(match.group()) if match else None
+
+
+def report_rollup(structured_data):
+    goal_status = {}
+    for goal in structured_data.get("goals", []):
+        status = goal.get("status") or "Unknown"
+        goal_status[status] = goal_status.get(status, 0) + 1
+
+    bmp_categories = {}
+    for bmp in structured_data.get("bmps", []):
+        entry = bmp_categories.setdefault(bmp.get("category") or "Uncategorized",
+                                          {"count": 0, "quantity": 0.0, "cost": 0.0})
+        entry["count"] += 1
+        entry["quantity"] += to_number(bmp.get("quantity")) or 0.0
+        entry["cost"] += to_number(bmp.get("cost")) or 0.0
+
+    metrics = {}
+    for row in structured_data.get("monitoring", []):
+        target, achieved = to_number(row.get("target")), to_number(row.get("value"))
+        if target is None and achieved is None:
+            continue
+        entry = metrics.setdefault(row.get("metricName") or "Unnamed", {"target": 0.0, "achieved": 0.0})
+        entry["target"] += target or 0.0
+        entry["achieved"] += achieved or 0.0
+
+    return {
+        "goalStatus": goal_status,
+        "bmpCategories": bmp_categories,
+        "metrics": metrics,
+        "counts": {
+            section: len(structured_data.get(section, []))
+            for section in ("goals", "bmps", "implementation", "monitoring", "outreach", "geographicAreas")
+        },
+    }
+
+
+def _add_nested(total, part):
+    for key, value in part.items():
+        if isinstance(value, dict):
+            _add_nested(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)):
+            total[key] = total.get(key, 0) + value
+
+
+def merge_rollups(rollups):
+    total = {"reports": 0, "goalStatus": {}, "bmpCategories": {}, "metrics": {}, "counts": {}}
+    for rollup in rollups:
+        total["reports"] += 1
+        for field in ("goalStatus", "bmpCategories", "metrics", "counts"):
+            _add_nested(total[field], rollup.get(field, {}))
+    return total
+
+
+def rollup_document(file_name, structured_data, updated_at=None):
+    """``updated_at`` is normally Firestore's SERVER_TIMESTAMP (commit time)."""
+    return {
+        "sourceFileName": file_name,
+        "updatedAt": updated_at if updated_at is not None else datetime.now(timezone.utc),
+        **report_rollup(structured_data),
+    }
+
+
+class RollupIndex:
+    """In-memory view of the rollups collection, refreshed incrementally.
+
+    The first refresh reads every rollup document (one small doc per
+    report); later refreshes only fetch documents updated within
+    ``REFRESH_OVERLAP`` of the newest one seen so far. Re-read documents
+    replace themselves by ``sourceFileName``, and ``version`` changes only
+    when the aggregate does, which callers can use for cache validation.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.version = 0
+        self._rollups = {}
+        self._last_seen = None
+        self._aggregate = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        query = self.db.collection(ROLLUP_COLLECTION)
+        if self._last_seen is not None:
+            query = query.where("updatedAt", ">", self._last_seen - REFRESH_OVERLAP)
+        fetched = [doc.to_dict() for doc in query.stream()]
+        with self._lock:
+            changed = False
+            for rollup in fetched:
+                if self._rollups.get(rollup["sourceFileName"]) != rollup:
+                    self._rollups[rollup["sourceFileName"]] = rollup
+                    changed = True
+                if self._last_seen is None or rollup["updatedAt"] > self._last_seen:
+                    self._last_seen = rollup["updatedAt"]
+            if not changed:
+                return False
+            self._aggregate = None
+            self.version += 1
+        return True
+
+    def aggregate(self):
+        with self._lock:
+            if self._aggregate is None:
+                self._aggregate = merge_rollups(self._rollups.values())
+            return self._aggregate
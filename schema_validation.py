@@ -0,0 +1,106 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from jsonschema.validators import validator_for
+
+import section_routing
+import tracing
+
+# Errors that are not inside any one section (e.g. the root is not an object).
+ROOT = "$root"
+
+REPAIR_PROMPT = """
+The `{section}` section of a JSON extraction failed schema validation.
+
+### Errors
+{errors}
+
+### Current value
+{value}
+
+### Schema
+{schema}
+
+Return only a JSON object of the form {{"{section}": ...}} that fixes these errors.
+Keep every entry and every valid value unchanged; only correct the invalid fields,
+using null where a correct value cannot be determined.
+"""
+
+
+class SchemaValidator:
+    """A validator compiled once from a report schema.
+
+    Unlike ``jsonschema.validate`` it collects every error rather than the
+    first, grouped by the top-level section they occur in, and can check a
+    single section against a sub-schema derived from the full one.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        self._cls = cls
+        self._validator = cls(schema)
+        self._section_validators = {}
+
+    def errors_by_section(self, data):
+        errors = {}
+        for error in self._validator.iter_errors(data):
+            path = list(error.absolute_path)
+            if path:
+                section = path[0]
+                message = f"{'/'.join(str(p) for p in path)}: {error.message}"
+                errors.setdefault(section, []).append(message)
+            elif error.validator == "required" and isinstance(data, dict):
+                # A missing section is reported on the root object.
+                for section in error.validator_value:
+                    if section not in data:
+                        errors.setdefault(section, []).append(f"{section}: missing")
+            else:
+                errors.setdefault(ROOT, []).append(error.message)
+        return errors
+
+    def section_schema(self, section):
+        return section_routing.sub_schema(self.schema, [section])
+
+    def section_errors(self, section, value):
+        if section not in self._section_validators:
+            self._section_validators[section] = self._cls(self.section_schema(section))
+        validator = self._section_validators[section]
+        return [error.message for error in validator.iter_errors({section: value})]
+
+
+def repair_sections(validator, data, errors, generate_fn, max_workers=4):
+    """Re-request only the invalid sections and merge the fixes into ``data``.
+
+    ``generate_fn(prompt, section_schema) -> dict`` makes the model call.
+    Sections are repaired concurrently. Returns the errors that remain
+    (empty when every section was fixed); root-level errors cannot be
+    repaired section by section and are returned unchanged.
+    """
+    sections = [s for s in errors if s != ROOT and s in validator.schema.get("properties", {})]
+    remaining = {s: msgs for s, msgs in errors.items() if s not in sections}
+
+    def repair(section):
+        tracing.count("repaired_sections")
+        prompt = REPAIR_PROMPT.format(
+            section=section,
+            errors="\n".join(f"- {message}" for message in errors[section]),
+            value=json.dumps(data.get(section), indent=2),
+            schema=json.dumps(validator.section_schema(section)["properties"][section], indent=2),
+        )
+        try:
+            fixed = generate_fn(prompt, validator.section_schema(section))
+        except Exception as e:
+            return section, None, [f"{section}: repair failed: {e}"]
+        value = fixed.get(section) if isinstance(fixed, dict) else None
+        return section, value, validator.section_errors(section, value)
+
+    if sections:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for section, value, section_errors in pool.map(tracing.propagate(repair), sections):
+                if section_errors:
+                    remaining[section] = section_errors
+                else:
+                    data[section] = value
+    return remaining
@@ -0,0 +1,182 @@
+"""Section-routed extraction.
+
+Instead of asking for every schema section from every chunk, a TF-IDF index
+over the pages picks the pages relevant to each section, and each section
+is extracted from just those pages with a sub-schema holding only that
+section. The section calls run concurrently and their results are merged
+into one report like chunk results are (see chunked_extraction).
+"""
+import math
+import os
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from chunked_extraction import (
+    DEFAULT_CHUNK_TOKENS, SECTIONS, default_concurrency, estimate_tokens, extract_chunked, merge_chunk_results,
+    split_into_chunks,
+)
+
+# Seed terms per section; two-word terms match as phrases.
+SECTION_KEYWORDS = {
+    "goals": ["goal", "goals", "objective", "objectives", "milestone", "milestones", "target", "progress",
+              "reduction", "achieve", "achieved", "status"],
+    "bmps": ["bmp", "bmps", "best management", "management practice", "practice", "practices", "cover crop",
+             "cover crops", "buffer", "buffers", "no-till", "filter strip", "terrace", "wetland restoration",
+             "cost", "costs", "cost-share", "installed", "quantity"],
+    "implementation": ["implementation", "schedule", "timeline", "phase", "milestone", "start", "completed",
+                       "complete", "begin", "year", "responsible", "funding"],
+    "monitoring": ["monitoring", "monitor", "sampling", "samples", "water quality", "baseline", "load", "loads",
+                   "mg/l", "concentration", "parameter", "station", "stations", "indicator", "indicators",
+                   "nitrogen", "phosphorus", "sediment", "e. coli"],
+    "outreach": ["outreach", "education", "educational", "workshop", "workshops", "meeting", "meetings",
+                 "stakeholder", "stakeholders", "newsletter", "field day", "landowner", "landowners", "public"],
+    "geographicAreas": ["watershed", "subwatershed", "subwatersheds", "acres", "land use", "cropland",
+                        "wetland", "wetlands", "huc", "county", "area", "boundary", "forest", "pasture"],
+}
+
+# Sections extracted together in one routed call; the summary's
+# completionRate comes from the goals pages.
+ROUTES = {
+    "goals": ("summary", "goals"),
+    "bmps": ("bmps",),
+    "implementation": ("implementation",),
+    "monitoring": ("monitoring",),
+    "outreach": ("outreach",),
+    "geographicAreas": ("geographicAreas",),
+}
+
+ROUTING_ENV_VAR = "SECTION_ROUTING"
+
+# A page is routed to a section when it scores at least this share of the
+# best page's score for that section.
+RELEVANCE_FRACTION = 0.2
+# When the routed pages add up to more than this multiple of the document
+# (sections spread over most pages), one full-schema pass over the chunks
+# is cheaper and is used instead.
+MAX_ROUTED_EXPANSION = 2.5
+# Documents this small (in tokens) go out as one full-schema call.
+SINGLE_CALL_TOKENS = 3000
+
+FOCUS_NOTE = (
+    "Only the {sections} part of the JSON is needed for this request; the other sections are "
+    "extracted separately. The text below is the part of the report relevant to it.\n\n"
+)
+
+_WORD_RE = re.compile(r"[a-z][a-z0-9./'-]*[a-z0-9]|[a-z]")
+
+
+def _terms(text):
+    words = _WORD_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class PageIndex:
+    """TF-IDF over pages (unigrams and bigrams), built once per document."""
+
+    def __init__(self, pages):
+        self.page_count = len(pages)
+        self._tf = [Counter(_terms(page or "")) for page in pages]
+        df = Counter(term for tf in self._tf for term in tf)
+        self._idf = {term: math.log((1 + self.page_count) / (1 + n)) + 1 for term, n in df.items()}
+
+    def scores(self, terms):
+        return [
+            sum((1 + math.log(tf[term])) * self._idf[term] for term in terms if term in tf)
+            for tf in self._tf
+        ]
+
+    def relevant_pages(self, terms, fraction=RELEVANCE_FRACTION):
+        """Page numbers (0-based, in page order) relevant to ``terms``.
+
+        Pages scoring at least ``fraction`` of the best score are chosen,
+        together with any matching page right after a chosen one (tables
+        often run onto the next page).
+        """
+        scores = self.scores(terms)
+        best = max(scores, default=0)
+        if best <= 0:
+            return []
+        chosen = {i for i, score in enumerate(scores) if score >= fraction * best}
+        chosen |= {i + 1 for i in chosen if i + 1 < self.page_count and scores[i + 1] > 0}
+        return sorted(chosen)
+
+
+def routing_enabled():
+    return os.environ.get(ROUTING_ENV_VAR, "1") != "0"
+
+
+def sub_schema(schema, sections):
+    """``schema`` reduced to the given top-level sections."""
+    return {
+        "type": "object",
+        "properties": {section: schema["properties"][section] for section in sections},
+        "required": list(sections),
+    }
+
+
+def route_pages(pages, index=None):
+    """``{route: [page numbers]}`` for every route with at least one relevant page."""
+    index = index or PageIndex(pages)
+    routes = {}
+    for route, keywords in SECTION_KEYWORDS.items():
+        page_numbers = index.relevant_pages(keywords)
+        if page_numbers:
+            routes[route] = page_numbers
+    return routes
+
+
+def extract_routed(pages, extract_sections, max_tokens=DEFAULT_CHUNK_TOKENS, max_workers=None,
+                   content_defined=False):
+    """Run ``extract_sections(text, sections) -> dict`` once per route and merge.
+
+    ``sections`` is the tuple of top-level keys wanted from that call
+    (callers build the matching ``sub_schema``). A route whose pages exceed
+    ``max_tokens`` is split into chunks like a full document would be
+    (``content_defined`` as in split_into_chunks).
+    Sections without any relevant page come back empty; when no page is
+    relevant to the goals route (which carries the summary), or routing would
+    resend too much text, the whole document is chunked instead. Exceptions
+    from a call propagate.
+    """
+    if isinstance(pages, str):
+        pages = [pages]
+    all_sections = tuple(["summary"] + SECTIONS)
+    page_tokens = [estimate_tokens(page) if page else 0 for page in pages]
+    if sum(page_tokens) <= SINGLE_CALL_TOKENS:
+        tracing.count("llm_chunks")
+        return extract_sections("\n".join(page for page in pages if page), all_sections)
+
+    with tracing.stage("page_index"):
+        routes = route_pages(pages)
+    routed_tokens = sum(page_tokens[i] for page_numbers in routes.values() for i in page_numbers)
+    # Without a goals route nothing would produce the summary (e.g. OCR noise
+    # or a non-English plan matches no keywords at all).
+    if "goals" not in routes or routed_tokens > MAX_ROUTED_EXPANSION * sum(page_tokens):
+        tracing.count("routing_fallbacks")
+        return extract_chunked(pages, lambda text: extract_sections(text, all_sections), max_tokens, max_workers,
+                               content_defined)
+    tracing.count("routed_pages", sum(len(page_numbers) for page_numbers in routes.values()))
+
+    tasks = []
+    for route, page_numbers in routes.items():
+        sections = ROUTES[route]
+        note = FOCUS_NOTE.format(sections=" and ".join(f"`{s}`" for s in sections))
+        for chunk in split_into_chunks([pages[i] for i in page_numbers], max_tokens, content_defined):
+            tasks.append((note + chunk, sections))
+    tracing.count("llm_chunks", len(tasks))
+
+    results = []
+    if tasks:
+        workers = min(max_workers or default_concurrency(), len(tasks))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(tracing.propagate(lambda task: extract_sections(*task)), tasks))
+
+    with tracing.stage("merge"):
+        # Pad every partial result to a full report so they merge like chunk
+        # results; the extra empty report makes sure the summary is recomputed.
+        padded = [{section: result.get(section) or [] for section in SECTIONS} | {"summary": result.get("summary")}
+                  for result in results]
+        padded.append({section: [] for section in SECTIONS})
+        return merge_chunk_results(padded)
@@ -0,0 +1,62 @@
+"""Where credentials come from.
+
+A secrets source is one of:
+
+- ``"env"``: ``GOOGLE_API_KEY`` plus the Firebase service account as JSON in
+  ``FIREBASE_CREDENTIALS_JSON`` or as a path in ``FIREBASE_CREDENTIALS_FILE``
+- ``"file:<path>"``: a TOML file laid out like ``.streamlit/secrets.toml``
+- ``"streamlit"``: ``st.secrets`` (only sensible inside a Streamlit app)
+
+``SECRETS_SOURCE`` in the environment selects one; otherwise env vars win if
+``GOOGLE_API_KEY`` is set, then ``.streamlit/secrets.toml``, then ``st.secrets``.
+"""
+import json
+import os
+import tomllib
+
+SECRETS_SOURCE_ENV_VAR = "SECRETS_SOURCE"
+DEFAULT_SECRETS_FILE = ".streamlit/secrets.toml"
+
+
+def _from_env():
+    secrets = {}
+    if "GOOGLE_API_KEY" in os.environ:
+        secrets["GOOGLE_API_KEY"] = os.environ["GOOGLE_API_KEY"]
+    if "FIREBASE_CREDENTIALS_JSON" in os.environ:
+        secrets["firebase"] = json.loads(os.environ["FIREBASE_CREDENTIALS_JSON"])
+    elif "FIREBASE_CREDENTIALS_FILE" in os.environ:
+        with open(os.environ["FIREBASE_CREDENTIALS_FILE"], "r", encoding="utf-8") as f:
+            secrets["firebase"] = json.load(f)
+    return secrets
+
+
+def _from_file(path):
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def _from_streamlit():
+    import streamlit as st
+
+    return {key: st.secrets[key] for key in st.secrets}
+
+
+def default_source():
+    if os.environ.get(SECRETS_SOURCE_ENV_VAR):
+        return os.environ[SECRETS_SOURCE_ENV_VAR]
+    if "GOOGLE_API_KEY" in os.environ:
+        return "env"
+    if os.path.exists(DEFAULT_SECRETS_FILE):
+        return f"file:{DEFAULT_SECRETS_FILE}"
+    return "streamlit"
+
+
+def load_secrets(source=None):
+    source = source or default_source()
+    if source == "env":
+        return _from_env()
+    if source.startswith("file:"):
+        return _from_file(source[len("file:"):])
+    if source == "streamlit":
+        return _from_streamlit()
+    raise ValueError(f"Unknown secrets source: {source!r}")
@@ -1,94 +1,146 @@
 import streamlit as st
-import pdfplumber
-import google.generativeai as genai
 import json
-import jsonschema
 import pandas as pd
 import plotly.express as px
 
+import extraction_cache
+import incremental_extraction
+import job_queue
+import pdf_extraction
+import report_frames
+import tracing
+
 # ---------------------- Setup ----------------------
 st.set_page_config(page_title="Watershed Plan Dashboard", layout="wide")
 
-# Configure Gemini API
-try:
-    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
-except KeyError:
-    st.error("❌ Missing API key in Streamlit secrets under GOOGLE_API_KEY")
-    st.stop()
-
-model = genai.GenerativeModel("gemini-1.5-flash")
+# Streamlit reruns this whole script on every widget interaction; anything
+# expensive below is cached at process level (st.cache_resource/cache_data)
+# or per session (st.session_state) so a rerun never repeats it. Extraction
+# itself runs in job_queue worker processes: the app only enqueues and
+# polls, so a browser refresh or a long job never kills or blocks it.
 
 # ---------------------- Schema Loader ----------------------
+@st.cache_resource
 def get_json_schema():
     with open("schema.json", "r", encoding="utf-8") as f:
         return json.load(f)
 
 schema = get_json_schema()
 
-# ---------------------- PDF Extractor ----------------------
-def extract_text_from_pdf(uploaded_file):
-    text_output = ""
-    with pdfplumber.open(uploaded_file) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text_output += page_text + "\n"
-    return text_output
-
-# ---------------------- Prompt Template ----------------------
-prompt_template = """
-You are a data extraction assistant specialized in agricultural and environmental reports.
-
-Your task is to extract structured data from the input report text and return it as a valid JSON object that strictly follows the defined schema.
-
----
-
-### 📄 Input Text:
-{text}
-
----
-
-### 🧩 JSON Structure (Schema):
-
-- summary: {{ "totalGoals": number, "totalBMPs": number, "completionRate": number }}
-- goals: [{{ "title": string, "description": string, "status": string, "target": string, "progress": number }}]
-- bmps: [{{ "title": string, "description": string, "category": string, "quantity": number, "cost": number }}]
-- implementation: [{{ "activity": string, "description": string, "startDate": string, "endDate": string, "status": string }}]
-- monitoring: [{{ "metricName": string, "value": string, "units": string, "description": string, "baseline": string, "target": string }}]
-- outreach: [{{ "activity": string, "description": string, "count": number }}]
-- geographicAreas: [{{ "name": string, "description": string, "acres": number, "croplandPct": number, "wetlandPct": number }}]
-
-⚠️ Rules:
-- All fields must be present.
-- If no data is found, return empty arrays.
-- completionRate must be a number 0–100 (integer).
-- Output only valid JSON, no commentary.
-
-Begin extraction now.
-"""
-
-
-# ---------------------- LLM Extractor ----------------------
-def llm_extract(text: str):
-    prompt = prompt_template.format(text=text[:10000])  # limit input size
-    response = model.generate_content(prompt)
-    raw_output = response.text.strip()
-
-    try:
-        data = json.loads(raw_output)
-        jsonschema.validate(instance=data, schema=schema)
-        return data
-    except json.JSONDecodeError:
-        st.error("⚠️ LLM output is not valid JSON")
-        st.text(raw_output)
-        return None
-    except jsonschema.ValidationError as e:
-        st.error(f"⚠️ JSON does not match schema\n\n{e.message}")
-        st.json(raw_output)
-        return None
+# ---------------------- Job Queue ----------------------
+@st.cache_resource
+def get_job_queue():
+    return job_queue.JobQueue()
+
+queue = get_job_queue()
+
+@st.cache_resource
+def start_workers():
+    # Once per server process, unless workers are already running (e.g.
+    # `python job_queue.py worker`); JOB_WORKERS=0 never starts any here.
+    if queue.live_workers():
+        return []
+    return job_queue.start_workers()
+
+start_workers()
+
+@st.cache_resource
+def start_metrics_server():
+    # Serves /metrics for the app and the queue's workers when METRICS_PORT
+    # is set, including workers started with `python job_queue.py worker`.
+    job_queue.share_metrics()
+    return tracing.start_metrics_server()
+
+start_metrics_server()
+
+cache = extraction_cache.get_default_cache()
+chunk_cache = incremental_extraction.get_chunk_cache()
+
+
+def get_file_hash(uploaded_file):
+    # Hash each upload once per session rather than on every rerun.
+    hashes = st.session_state.setdefault("file_hashes", {})
+    if uploaded_file.file_id not in hashes:
+        hashes[uploaded_file.file_id] = pdf_extraction.file_sha256(uploaded_file)
+    return hashes[uploaded_file.file_id]
+
+
+@st.cache_data(show_spinner=False)
+def load_job_result(job_id):
+    # A finished job's result never changes.
+    return queue.get(job_id)["result"]
+
+
+@st.fragment(run_every=job_queue.POLL_SECONDS)
+def job_progress(job_id):
+    job = queue.get(job_id)
+    if job["status"] in (job_queue.DONE, job_queue.DEAD):
+        st.rerun()
+    st.progress(job["progress"], text=f"{job['stage'].capitalize()}... (attempt {max(job['attempts'], 1)}/{job['maxAttempts']})")
+    if job["error"]:
+        st.caption(f"Last attempt failed: {job['error']}")
+    if not queue.live_workers():
+        st.warning("No extraction worker is running. Start one with `python job_queue.py worker`.")
+
+
+@st.cache_data(show_spinner=False)
+def build_frames(job_id, _report):
+    # Typed columns (numbers coerced, categoricals, dates) built once per report.
+    return report_frames.normalize_report(_report)
 
 # ---------------------- Dashboard Renderer ----------------------
-def render_dashboard(report):
+def bar_chart(df, x, y, title, color=None, agg="sum"):
+    # Large sections are aggregated to at most report_frames.MAX_BARS bars.
+    data = report_frames.chart_frame(df, x, y, color=color, agg=agg)
+    if len(data) < len(df):
+        title = f"{title} (top {len(data)} of {len(df)})"
+    st.plotly_chart(px.bar(data, x=x, y=y, color=color, title=title), use_container_width=True)
+
+
+def render_goals(df):
+    st.dataframe(df)
+    bar_chart(df, "title", "progress", "Goal Progress", color="status", agg="mean")
+
+
+def render_bmps(df):
+    st.dataframe(df)
+    bar_chart(df, "title", "quantity", "BMP Quantities", color="category")
+    bar_chart(df, "title", "cost", "BMP Costs", color="category")
+
+
+def render_implementation(df):
+    st.dataframe(df)
+
+
+def render_monitoring(df):
+    st.dataframe(df)
+    bar_chart(df.dropna(subset=["value"]), "metricName", "value", "Monitoring Values", color="units")
+
+
+def render_outreach(df):
+    st.dataframe(df)
+    bar_chart(df, "activity", "count", "Outreach Activity Counts")
+
+
+def render_geographic_areas(df):
+    st.dataframe(df)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Total Acres", f"{df['acres'].sum():,.0f}")
+    col2.metric("Cropland %", f"{df['croplandPct'].mean():.1f}%")
+    col3.metric("Wetland %", f"{df['wetlandPct'].mean():.1f}%")
+
+
+SECTION_VIEWS = {
+    "🎯 Goals": ("goals", render_goals),
+    "🌱 BMPs": ("bmps", render_bmps),
+    "🛠 Implementation": ("implementation", render_implementation),
+    "📊 Monitoring": ("monitoring", render_monitoring),
+    "📢 Outreach": ("outreach", render_outreach),
+    "🗺 Geographic Areas": ("geographicAreas", render_geographic_areas),
+}
+
+
+def render_dashboard(report, frames):
     st.title("🌊 Watershed Plan Dashboard")
 
     # --- Summary
@@ -99,68 +151,61 @@ def render_dashboard(report):
 
     st.markdown("---")
 
-    # --- Goals
-    st.subheader("🎯 Goals")
-    if report["goals"]:
-        goals_df = pd.DataFrame(report["goals"])
-        st.dataframe(goals_df)
-        fig_goals = px.bar(goals_df, x="title", y="progress", color="status", title="Goal Progress")
-        st.plotly_chart(fig_goals, use_container_width=True)
+    # Only the selected section is rendered, so a rerun draws one section's
+    # table and charts instead of all of them.
+    label = st.radio("Section", list(SECTION_VIEWS), horizontal=True, label_visibility="collapsed")
+    section, render = SECTION_VIEWS[label]
+    if section in frames:
+        render(frames[section])
     else:
-        st.info("No goals found.")
-
-    # --- BMPs
-    st.subheader("🌱 Best Management Practices (BMPs)")
-    if report["bmps"]:
-        bmps_df = pd.DataFrame(report["bmps"])
-        st.dataframe(bmps_df)
-        fig_bmp_qty = px.bar(bmps_df, x="title", y="quantity", color="category", title="BMP Quantities")
-        st.plotly_chart(fig_bmp_qty, use_container_width=True)
-        fig_bmp_cost = px.bar(bmps_df, x="title", y="cost", color="category", title="BMP Costs")
-        st.plotly_chart(fig_bmp_cost, use_container_width=True)
-
-    # --- Implementation
-    st.subheader("🛠 Implementation Activities")
-    if report["implementation"]:
-        impl_df = pd.DataFrame(report["implementation"])
-        st.dataframe(impl_df)
-
-    # --- Monitoring
-    st.subheader("📊 Monitoring Metrics")
-    if report["monitoring"]:
-        monitor_df = pd.DataFrame(report["monitoring"])
-        st.dataframe(monitor_df)
-        fig_monitor = px.bar(monitor_df, x="metricName", y="value", color="units", title="Monitoring Values")
-        st.plotly_chart(fig_monitor, use_container_width=True)
-
-    # --- Outreach
-    st.subheader("📢 Outreach Activities")
-    if report["outreach"]:
-        outreach_df = pd.DataFrame(report["outreach"])
-        st.dataframe(outreach_df)
-        fig_outreach = px.bar(outreach_df, x="activity", y="count", title="Outreach Activity Counts")
-        st.plotly_chart(fig_outreach, use_container_width=True)
-
-    # --- Geographic Areas
-    st.subheader("🗺 Geographic Areas")
-    if report["geographicAreas"]:
-        geo_df = pd.DataFrame(report["geographicAreas"])
-        st.dataframe(geo_df)
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Total Acres", geo_df["acres"].sum())
-        col2.metric("Cropland %", f"{geo_df['croplandPct'].mean():.1f}%")
-        col3.metric("Wetland %", f"{geo_df['wetlandPct'].mean():.1f}%")
+        st.info(f"No {label.split(' ', 1)[1].lower()} found.")
 
 # ---------------------- Streamlit UI ----------------------
 st.header("📤 Upload Watershed Report")
 uploaded_file = st.file_uploader("Upload PDF", type="pdf")
 
-if uploaded_file:
-    with st.spinner("Extracting text..."):
-        pdf_text = extract_text_from_pdf(uploaded_file)
+# Extraction job per uploaded file (by content hash) in this session.
+jobs = st.session_state.setdefault("jobs", {})
+
+with st.sidebar:
+    upload = st.checkbox("Also upload reports to Firestore")
+    st.subheader("Cache")
+    if st.button("Clear in-memory caches"):
+        load_job_result.clear()
+        build_frames.clear()
+    if st.button("Clear on-disk extraction cache"):
+        cache.clear()
+        chunk_cache.clear()
 
-    with st.spinner("Running LLM extraction..."):
-        report = llm_extract(pdf_text)
+if uploaded_file:
+    file_hash = get_file_hash(uploaded_file)
+    refresh = st.sidebar.button("Re-extract this file")
+    if refresh or file_hash not in jobs:
+        # Returns the existing job when this file was already queued or done.
+        jobs[file_hash] = queue.enqueue(uploaded_file, uploaded_file.name, upload=upload, refresh=refresh)
+    job = queue.get(jobs[file_hash])
+
+    if job["status"] == job_queue.DONE:
+        result = load_job_result(job["id"])
+        report, timings = result["data"], result["trace"]
+        if result.get("validationErrors"):
+            messages = "\n".join(m for errors in result["validationErrors"].values() for m in errors)
+            st.warning(f"⚠️ JSON does not fully match schema\n\n{messages}")
+        with st.sidebar.expander("⏱ Timings"):
+            st.caption(f"Total {timings['totalSeconds']:.2f}s")
+            st.dataframe(pd.DataFrame(tracing.timings_table(timings)), hide_index=True)
+            st.json(timings["counters"])
+        render_dashboard(report, build_frames(job["id"], report))
+    elif job["status"] == job_queue.DEAD:
+        st.error(f"❌ Extraction failed after {job['attempts']} attempts: {job['error']}")
+        if st.button("Retry extraction"):
+            queue.retry(job["id"])
+            st.rerun()
+    else:
+        job_progress(job["id"])
 
-    if report:
-        render_dashboard(report)
+stats = queue.stats()
+st.sidebar.caption(
+    f"Jobs: {stats['queued']} queued, {stats['running']} running, {stats['done']} done, "
+    f"{stats['dead']} failed; {stats['workers']} worker(s)"
+)
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# Root modules, and the offline fakes in benchmarks/.
+sys.path[:0] = [str(ROOT), str(ROOT / "benchmarks")]
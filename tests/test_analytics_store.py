@@ -0,0 +1,24 @@
+import analytics_store
+
+REPORT = {
+    "summary": {"totalGoals": 1, "totalBMPs": 2, "completionRate": 40},
+    "goals": [{"title": "Reduce nitrogen", "status": "In Progress", "progress": "40%"}],
+    "bmps": [
+        {"title": "Cover crops", "category": "Agricultural", "quantity": "1,200 acres", "cost": "$30,000"},
+        {"title": "Buffer strips", "category": "Agricultural", "quantity": "15 miles", "cost": 12000},
+    ],
+}
+
+
+def test_record_report_round_trips_through_query(tmp_path, monkeypatch):
+    monkeypatch.setenv(analytics_store.STORE_DIR_ENV_VAR, str(tmp_path))
+    monkeypatch.setattr(analytics_store, "_default_store", None)
+
+    report_id = analytics_store.record_report("plan.pdf", REPORT)
+
+    assert report_id is not None
+    reports = analytics_store.query(analytics_store.REPORTS)
+    assert reports["reportId"].tolist() == [report_id]
+    assert reports["totalBMPs"].tolist() == [2.0]
+    costs = analytics_store.query("bmps", group_by=["category"], aggregates={"cost": "sum"})
+    assert costs.to_dict("records") == [{"category": "Agricultural", "cost_sum": 42000.0}]
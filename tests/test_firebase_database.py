@@ -0,0 +1,67 @@
+import pytest
+
+import firebase_database
+from conftest import ROOT
+from fakes import FakeFirestore
+
+
+@pytest.fixture
+def db():
+    db = FakeFirestore()
+    firebase_database.use_clients(db=db)
+    yield db
+    firebase_database.configure()
+
+
+def _report(*goals):
+    return {"summary": {"totalGoals": len(goals)}, "goals": list(goals)}
+
+
+def _goals(db, file_name):
+    return {doc.to_dict()["title"] for doc in db.collection("goals").where("sourceFileName", "==", file_name).stream()}
+
+
+@pytest.mark.parametrize("upload", [firebase_database.sync_data_incremental, firebase_database.upload_data_normalized])
+def test_model_supplied_ids_do_not_collide_across_reports(db, upload):
+    a = _report({"id": "1", "title": "Reduce nitrogen"})
+    b = _report({"id": "1", "title": "Restore wetlands"})
+
+    upload("a.pdf", a["summary"], a)
+    upload("b.pdf", b["summary"], b)
+    upload("a.pdf", a["summary"], a)
+
+    assert _goals(db, "a.pdf") == {"Reduce nitrogen"}
+    assert _goals(db, "b.pdf") == {"Restore wetlands"}
+
+
+def test_incremental_sync_counts_added_changed_and_removed(db):
+    nitrogen = {"id": "1", "title": "Reduce nitrogen"}
+    wetlands = {"id": "2", "title": "Restore wetlands"}
+    first = firebase_database.sync_data_incremental("a.pdf", {"totalGoals": 2}, _report(nitrogen, wetlands))
+    assert first["sections"]["goals"] == {"added": 2, "changed": 0, "removed": 0, "unchanged": 0}
+
+    writes = db.counters["writes"]
+    again = firebase_database.sync_data_incremental("a.pdf", {"totalGoals": 2}, _report(nitrogen, wetlands))
+    assert again["sections"]["goals"] == {"added": 0, "changed": 0, "removed": 0, "unchanged": 2}
+    assert db.counters["writes"] == writes
+
+    edited = {**nitrogen, "title": "Reduce nitrogen by 20%"}
+    forests = {"id": "3", "title": "Protect forests"}
+    third = firebase_database.sync_data_incremental("a.pdf", {"totalGoals": 2}, _report(edited, forests))
+    assert third["sections"]["goals"] == {"added": 1, "changed": 1, "removed": 1, "unchanged": 0}
+    assert _goals(db, "a.pdf") == {"Reduce nitrogen by 20%", "Protect forests"}
+
+
+def test_incremental_sync_leaves_other_files_alone(db):
+    firebase_database.sync_data_incremental("a.pdf", {"totalGoals": 1}, _report({"id": "1", "title": "Reduce nitrogen"}))
+    firebase_database.sync_data_incremental("b.pdf", {"totalGoals": 1}, _report({"id": "1", "title": "Restore wetlands"}))
+
+    result = firebase_database.sync_data_incremental("a.pdf", {"totalGoals": 0}, _report())
+    assert result["sections"]["goals"]["removed"] == 1
+    assert _goals(db, "a.pdf") == set()
+    assert _goals(db, "b.pdf") == {"Restore wetlands"}
+
+
+def test_prompt_template_inserts_the_text_once():
+    template = firebase_database.get_prompt_template(str(ROOT / "prompt.txt"))
+    assert template.format(pdf_text="<chunk text>").count("<chunk text>") == 1
@@ -0,0 +1,52 @@
+import pytest
+
+import firestore_bulk
+from fakes import FakeFirestore, FakeFirestoreError
+
+
+def test_writes_are_split_into_batches_of_at_most_500():
+    db = FakeFirestore()
+    coll_ref = db.collection("goals")
+    with firestore_bulk.BulkWriter(db, max_workers=4) as writer:
+        for i in range(1201):
+            writer.set(coll_ref.document(str(i)), {"n": i})
+
+    assert db.counters["commits"] == 3
+    assert db.counters["writes"] == 1201
+    stats = writer.stats()
+    assert (stats["operations"], stats["batches"], stats["retries"]) == (1201, 3, 0)
+
+
+def test_batch_size_is_capped_at_the_firestore_limit():
+    db = FakeFirestore()
+    with firestore_bulk.BulkWriter(db, batch_size=1000) as writer:
+        for i in range(1000):
+            writer.set(db.collection("goals").document(str(i)), {"n": i})
+
+    assert writer.batch_size == firestore_bulk.FIRESTORE_BATCH_LIMIT
+    assert db.counters["commits"] == 2
+
+
+def test_delete_where_removes_only_matching_docs():
+    db = FakeFirestore()
+    with firestore_bulk.BulkWriter(db) as writer:
+        for i in range(600):
+            writer.set(db.collection("goals").document(str(i)), {"sourceFileName": f"{i % 2}.pdf"})
+    with firestore_bulk.BulkWriter(db) as writer:
+        firestore_bulk.delete_where(writer, [db.collection("goals")], "sourceFileName", "0.pdf")
+
+    remaining = [doc.to_dict()["sourceFileName"] for doc in db.collection("goals").stream()]
+    assert len(remaining) == 300 and set(remaining) == {"1.pdf"}
+
+
+def test_failed_commit_is_raised_from_flush():
+    db = FakeFirestore()
+
+    def failing_batch():
+        raise FakeFirestoreError("permission denied", code=403)
+
+    db.batch = failing_batch
+    writer = firestore_bulk.BulkWriter(db)
+    writer.set(db.collection("goals").document("1"), {"n": 1})
+    with pytest.raises(FakeFirestoreError):
+        writer.close()
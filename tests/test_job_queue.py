@@ -0,0 +1,180 @@
+import json
+
+import pytest
+
+import job_queue
+from conftest import ROOT
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    # Keep every cache and log the pipeline touches inside tmp_path.
+    for name, value in {
+        "TRACE_LOG": "",
+        "EXTRACTION_CACHE_DIR": tmp_path / "extractions",
+        "CHUNK_CACHE_DIR": tmp_path / "chunks",
+        "PAGE_MANIFEST_DIR": tmp_path / "manifests",
+        "ANALYTICS_STORE_DIR": tmp_path / "analytics",
+        "METRICS_DIR": tmp_path / "metrics",
+    }.items():
+        monkeypatch.setenv(name, str(value))
+    return job_queue.JobQueue(tmp_path / "jobs.sqlite3")
+
+
+def test_identical_request_returns_existing_job(queue):
+    first = queue.enqueue(b"%PDF-1", "a.pdf")
+    assert queue.enqueue(b"%PDF-1", "a.pdf") == first
+    assert queue.enqueue(b"%PDF-1", "a.pdf", refresh=True) != first
+
+
+def test_claim_runs_oldest_job_once(queue):
+    first = queue.enqueue(b"%PDF-1", "a.pdf")
+    second = queue.enqueue(b"%PDF-2", "b.pdf")
+
+    assert queue.claim("w1")["id"] == first
+    assert queue.claim("w2")["id"] == second
+    assert queue.claim("w3") is None
+    assert queue.get(first)["status"] == job_queue.RUNNING
+
+
+def test_expired_lease_is_reclaimed_and_old_worker_ignored(queue):
+    job_id = queue.enqueue(b"%PDF-1", "a.pdf")
+    stale = queue.claim("w1")
+    queue._conn().execute("UPDATE jobs SET lease_expires = 0 WHERE id = ?", (job_id,))
+
+    job = queue.claim("w2")
+    assert job["id"] == job_id and job["attempts"] == 2
+    assert not queue.complete(job_id, "w1", {"data": {}})
+    assert queue.fail(job_id, "w1", "late") is None
+    assert queue.get(job_id)["status"] == job_queue.RUNNING
+
+    assert queue.complete(job_id, "w2", {"data": {"ok": True}})
+    assert queue.get(job_id)["result"] == {"data": {"ok": True}}
+    assert not (queue.files_dir / f"{job_id}.pdf").exists()
+    assert stale["pdfPath"] == job["pdfPath"]
+
+
+def test_failures_back_off_then_dead_letter(queue, monkeypatch):
+    monkeypatch.setattr(job_queue, "RETRY_BASE_DELAY", 0)
+    job_id = queue.enqueue(b"%PDF-1", "a.pdf", max_attempts=2)
+
+    queue.claim("w1")
+    assert queue.fail(job_id, "w1", "boom") == job_queue.QUEUED
+    queue.claim("w1")
+    assert queue.fail(job_id, "w1", "boom again") == job_queue.DEAD
+    assert queue.claim("w1") is None
+    job = queue.get(job_id)
+    assert (job["status"], job["error"], job["attempts"]) == (job_queue.DEAD, "boom again", 2)
+
+    assert queue.retry(job_id)
+    assert queue.claim("w1")["attempts"] == 1
+
+
+def test_job_whose_workers_keep_dying_is_dead_lettered(queue):
+    job_id = queue.enqueue(b"%PDF-1", "a.pdf", max_attempts=1)
+    queue.claim("w1")
+    queue._conn().execute("UPDATE jobs SET lease_expires = 0 WHERE id = ?", (job_id,))
+
+    assert queue.claim("w2") is None
+    assert queue.get(job_id)["status"] == job_queue.DEAD
+
+
+def _stub_worker(db_path):
+    import firebase_database
+    from fakes import StubModel
+
+    schema = firebase_database.get_json_schema(str(ROOT / "schema.json"))
+    firebase_database.use_clients(model=StubModel(schema, latency=0, items_per_section=2))
+    job_queue.worker_main(db_path, "test-worker", once=True)
+
+
+def test_worker_process_can_use_process_pools(queue, monkeypatch):
+    from synthetic_pdfs import generate_plan_pdf
+
+    # Large enough for the parallel text-layer path, small enough not to stream.
+    monkeypatch.setenv("PDF_EXTRACT_WORKERS", "4")
+    monkeypatch.setenv("PDF_STREAMING", "0")
+    monkeypatch.setenv("OCR_ENABLED", "0")
+    job_id = queue.enqueue(generate_plan_pdf(100), "plan.pdf")
+
+    worker = job_queue.spawn_worker(_stub_worker, (str(queue.db_path),))
+    worker.join(timeout=120)
+
+    job = queue.get(job_id)
+    assert job["status"] == job_queue.DONE, job["error"]
+    assert job["result"]["trace"]["counters"]["pages"] == 100
+    assert json.dumps(job["result"]["data"])
+    assert job["result"]["textPreview"]["truncated"]
+
+
+def _hold_slot(slot_dir, limit, hold, log):
+    import time
+
+    import call_slots
+
+    slots = call_slots.get_call_slots(slot_dir)
+    slots.set_limit(limit)
+    with slots.slot():
+        with open(log, "a") as f:
+            f.write(f"start {time.monotonic()}\n")
+        time.sleep(hold)
+        with open(log, "a") as f:
+            f.write(f"end {time.monotonic()}\n")
+
+
+def test_model_call_slots_cap_calls_across_processes(tmp_path):
+    log = tmp_path / "calls.log"
+    workers = [job_queue.spawn_worker(_hold_slot, (str(tmp_path / "slots"), 2, 0.5, str(log))) for _ in range(4)]
+    for worker in workers:
+        worker.join(timeout=60)
+
+    events = sorted((float(t), kind) for kind, t in (line.split() for line in log.read_text().splitlines()))
+    in_flight = peak = 0
+    for _, kind in events:
+        in_flight += 1 if kind == "start" else -1
+        peak = max(peak, in_flight)
+    assert len(events) == 8 and peak == 2
+
+
+def _claim(queue, pdf, file_name):
+    queue.enqueue(pdf, file_name)
+    return queue.claim("test-worker")
+
+
+def test_repaired_report_is_cached_and_options_change_the_key(queue, monkeypatch):
+    import firebase_database
+    from fakes import StubModel
+    from synthetic_pdfs import generate_plan_pdf
+
+    class RepairingModel(StubModel):
+        # Every extraction has out-of-range goal progress; repairs are valid.
+        def generate_content(self, prompt, generation_config=None):
+            response = super().generate_content(prompt, generation_config)
+            report = json.loads(response.text)
+            if "failed schema validation" in prompt:
+                report = {"goals": report["goals"]}
+            else:
+                for goal in report.get("goals", []):
+                    goal["progress"] = 500
+            response.text = json.dumps(report)
+            return response
+
+    monkeypatch.setenv("OCR_ENABLED", "0")
+    schema = firebase_database.get_json_schema(str(ROOT / "schema.json"))
+    model = RepairingModel(schema, latency=0, items_per_section=2)
+    firebase_database.use_clients(model=model)
+    pdf = generate_plan_pdf(5)
+    try:
+        first = job_queue.run_job(_claim(queue, pdf, "a.pdf"), lambda *args: None)
+        calls = model.calls
+        second = job_queue.run_job(_claim(queue, pdf, "b.pdf"), lambda *args: None)
+    finally:
+        firebase_database.configure()
+
+    assert first["validationErrors"] == {} and second["validationErrors"] == {}
+    assert model.calls == calls
+    assert second["data"] == first["data"]
+
+    key = firebase_database.extraction_cache_key(pdf, schema, "{pdf_text}")
+    monkeypatch.setenv("SECTION_ROUTING", "0")
+    assert firebase_database.extraction_cache_key(pdf, schema, "{pdf_text}") != key
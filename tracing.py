@@ -0,0 +1,307 @@
+"""Per-report tracing and process-wide metrics.
+
+Wrap the processing of one report in ``start_trace(name)``; code anywhere
+below it records into that trace with ``stage(name)`` (wall time) and
+``count(counter, n)`` (pages, tokens, retries, Firestore operations, ...).
+Both are no-ops when no trace is active. Work fanned out to thread pools
+keeps the caller's trace when the submitted function is wrapped with
+``propagate(fn)``.
+
+A finished trace is appended as one JSON line to ``TRACE_LOG`` (default
+``.cache/traces.jsonl``; empty disables) and folded into Prometheus-style
+metrics, which can be written to ``METRICS_FILE`` after every report and/or
+served over HTTP with ``start_metrics_server(port)`` (or set ``METRICS_PORT``
+and call ``start_metrics_server()``).
+
+Processes that share ``METRICS_DIR`` (e.g. a pool of job workers) each keep
+a snapshot of their metrics there, one file per process, and report the sum
+over all of them, so any one process can serve the pool's metrics.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+TRACE_LOG_ENV_VAR = "TRACE_LOG"
+DEFAULT_TRACE_LOG = ".cache/traces.jsonl"
+METRICS_FILE_ENV_VAR = "METRICS_FILE"
+METRICS_PORT_ENV_VAR = "METRICS_PORT"
+METRICS_DIR_ENV_VAR = "METRICS_DIR"
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    def __init__(self, name, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = attributes
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self.finished = None
+        self.spans = []
+        self.counters = {}
+        self.error = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.spans.append((name, started, time.perf_counter()))
+
+    def count(self, counter, n=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def stages(self):
+        """Per stage: number of calls, summed seconds, and wall-clock seconds
+        from first start to last end (smaller than the sum when calls overlap)."""
+        summary = {}
+        with self._lock:
+            spans = list(self.spans)
+        for name, started, ended in spans:
+            entry = summary.setdefault(name, {"calls": 0, "seconds": 0.0, "_first": started, "_last": ended})
+            entry["calls"] += 1
+            entry["seconds"] += ended - started
+            entry["_first"] = min(entry["_first"], started)
+            entry["_last"] = max(entry["_last"], ended)
+        for entry in summary.values():
+            entry["wallSeconds"] = entry.pop("_last") - entry.pop("_first")
+        return summary
+
+    def to_dict(self):
+        ended = self.finished if self.finished is not None else time.perf_counter()
+        return {
+            "traceId": self.trace_id,
+            "name": self.name,
+            "startedAt": self.started_at.isoformat(),
+            "totalSeconds": ended - self._started,
+            "stages": self.stages(),
+            "counters": dict(self.counters),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+# ---------- Recording ----------
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def start_trace(name, **attributes):
+    trace = Trace(name, **attributes)
+    token = _current.set(trace)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        trace.finished = time.perf_counter()
+        _finish(trace)
+
+
+@contextmanager
+def stage(name):
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    with trace.stage(name):
+        yield
+
+
+def count(counter, n=1):
+    trace = _current.get()
+    if trace is not None:
+        trace.count(counter, n)
+
+
+def record_usage(response):
+    """Count prompt/response tokens from a Gemini response's usage metadata."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        count("prompt_tokens", getattr(usage, "prompt_token_count", 0) or 0)
+        count("response_tokens", getattr(usage, "candidates_token_count", 0) or 0)
+
+
+def propagate(fn):
+    """Bind the caller's current trace to ``fn`` for use in another thread."""
+    trace = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(trace)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return run
+
+
+def timings_table(trace_dict):
+    """Rows (one per stage) for showing a finished trace in a table."""
+    return [
+        {"stage": name, "calls": entry["calls"], "seconds": round(entry["seconds"], 3),
+         "wallSeconds": round(entry["wallSeconds"], 3)}
+        for name, entry in trace_dict["stages"].items()
+    ]
+
+
+# ---------- Sinks ----------
+_log_lock = threading.Lock()
+_metrics_lock = threading.Lock()
+_metrics = {
+    "reports": 0,
+    "report_errors": 0,
+    "report_seconds": 0.0,
+    "stage_seconds": {},
+    "stage_calls": {},
+    "counters": {},
+}
+
+
+def _finish(trace):
+    record = trace.to_dict()
+    log_path = os.environ.get(TRACE_LOG_ENV_VAR, DEFAULT_TRACE_LOG)
+    if log_path:
+        Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+        line = json.dumps(record, default=str) + "\n"
+        with _log_lock, open(log_path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    with _metrics_lock:
+        _metrics["reports"] += 1
+        _metrics["report_errors"] += 1 if trace.error else 0
+        _metrics["report_seconds"] += record["totalSeconds"]
+        for name, entry in record["stages"].items():
+            _metrics["stage_seconds"][name] = _metrics["stage_seconds"].get(name, 0.0) + entry["seconds"]
+            _metrics["stage_calls"][name] = _metrics["stage_calls"].get(name, 0) + entry["calls"]
+        for name, value in record["counters"].items():
+            _metrics["counters"][name] = _metrics["counters"].get(name, 0) + value
+
+    metrics_dir = os.environ.get(METRICS_DIR_ENV_VAR)
+    if metrics_dir:
+        with _metrics_lock:
+            snapshot = json.dumps(_metrics)
+        Path(metrics_dir).mkdir(parents=True, exist_ok=True)
+        _write_atomic(Path(metrics_dir) / f"{_snapshot_name()}.json", snapshot)
+
+    metrics_path = os.environ.get(METRICS_FILE_ENV_VAR)
+    if metrics_path:
+        _write_atomic(metrics_path, render_metrics())
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+_snapshot = {}
+
+
+def _snapshot_name():
+    # Unique per process, including children forked after first use; a
+    # recycled pid never overwrites an earlier process's totals.
+    if _snapshot.get("pid") != os.getpid():
+        _snapshot.update(pid=os.getpid(), name=f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+    return _snapshot["name"]
+
+
+def _add_metrics(total, part):
+    for key, value in part.items():
+        if isinstance(value, dict):
+            _add_metrics(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def collect_metrics():
+    """This process's metrics plus the snapshots of the others in METRICS_DIR."""
+    with _metrics_lock:
+        total = json.loads(json.dumps(_metrics))
+    metrics_dir = os.environ.get(METRICS_DIR_ENV_VAR)
+    if metrics_dir and Path(metrics_dir).is_dir():
+        own = f"{_snapshot_name()}.json"
+        for path in Path(metrics_dir).glob("*.json"):
+            if path.name == own:
+                continue
+            try:
+                _add_metrics(total, json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue
+    return total
+
+
+def render_metrics():
+    """Current metrics in the Prometheus text exposition format."""
+    metrics = collect_metrics()
+    lines = [
+        "# TYPE pipeline_reports_total counter",
+        f"pipeline_reports_total {metrics['reports']}",
+        "# TYPE pipeline_report_errors_total counter",
+        f"pipeline_report_errors_total {metrics['report_errors']}",
+        "# TYPE pipeline_report_seconds_total counter",
+        f"pipeline_report_seconds_total {metrics['report_seconds']:.6f}",
+        "# TYPE pipeline_stage_seconds_total counter",
+    ]
+    lines += [
+        f'pipeline_stage_seconds_total{{stage="{name}"}} {seconds:.6f}'
+        for name, seconds in sorted(metrics["stage_seconds"].items())
+    ]
+    lines.append("# TYPE pipeline_stage_calls_total counter")
+    lines += [
+        f'pipeline_stage_calls_total{{stage="{name}"}} {calls}'
+        for name, calls in sorted(metrics["stage_calls"].items())
+    ]
+    lines += [
+        f"# TYPE pipeline_{name}_total counter\npipeline_{name}_total {value}"
+        for name, value in sorted(metrics["counters"].items())
+    ]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server = None
+
+
+def start_metrics_server(port=None, host="0.0.0.0"):
+    """Serve /metrics from a daemon thread (once per process).
+
+    Without ``port``, uses METRICS_PORT and does nothing if it is unset.
+    """
+    global _metrics_server
+    port = port or int(os.environ.get(METRICS_PORT_ENV_VAR, 0))
+    if _metrics_server is None and port:
+        _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+    return _metrics_server